@@ -6,6 +6,8 @@ Created on Mon Jun 15 16:55:44 202.
 """
 
 import os
+import io
+import inspect
 import pickle
 import numpy as np
 import json
@@ -16,7 +18,7 @@ os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
 import tensorflow as tf
 from tensorflow.keras.models import Model, load_model
-from tensorflow.keras.utils import plot_model
+from tensorflow.keras.utils import model_to_dot
 from tensorflow.keras import backend as K
 
 from .data_handling import DataHandler
@@ -25,6 +27,15 @@ from .utils import WeightDistributions
 
 from . import models
 
+# All model classes from the models module, as needed in the
+# custom_objects of the load_model method from Keras. Collected once
+# on import.
+MODELS_CUSTOM_OBJECTS = {
+    obj.__module__ + "." + obj.__name__: obj
+    for name, obj in inspect.getmembers(models, inspect.isclass)
+    if obj.__module__.startswith("xpsdeeplearning.network.models")
+}
+
 #%%
 class Classifier:
     """Class for training and testing a Keras model."""
@@ -114,7 +125,7 @@ class Classifier:
 
     def save_and_print_model_image(self):
         """
-        Plot the model using the plot_model method from keras.
+        Plot the model using the model_to_dot method from keras.
         
         Save the image to a file in the figure directory.
 
@@ -124,14 +135,18 @@ class Classifier:
 
         """
         fig_file_name = os.path.join(self.logging.fig_dir, "model.png")
-        plot_model(
+        dot = model_to_dot(
             self.model,
-            to_file=fig_file_name,
             rankdir="LR",
             show_shapes=True,
             show_layer_names=True,
         )
-        model_plot = plt.imread(fig_file_name)
+        # Render the PNG once and reuse the bytes for both the file
+        # and the plot instead of reading the file back in.
+        png_bytes = dot.create(prog="dot", format="png")
+        with open(fig_file_name, "wb") as fig_file:
+            fig_file.write(png_bytes)
+        model_plot = plt.imread(io.BytesIO(png_bytes))
         fig, ax = plt.subplots(figsize=(18, 2))
         ax.imshow(model_plot, interpolation="nearest")
         plt.tight_layout()
@@ -240,14 +255,18 @@ class Classifier:
             # Train the model and store the previous and the new
             # results in the history attribute.
             training = self.model.fit(
-                self.datahandler.X_train,
-                self.datahandler.y_train,
-                validation_data=(
+                self._make_dataset(
+                    self.datahandler.X_train,
+                    self.datahandler.y_train,
+                    batch_size=batch_size,
+                    shuffle=True,
+                ),
+                validation_data=self._make_dataset(
                     self.datahandler.X_val,
                     self.datahandler.y_val,
+                    batch_size=batch_size,
                 ),
                 epochs=epochs + epochs_trained,
-                batch_size=self.logging.hyperparams["batch_size"],
                 initial_epoch=epochs_trained,
                 verbose=verbose,
                 callbacks=self.logging.active_cbs,
@@ -294,9 +313,11 @@ class Classifier:
             is returned.
         """
         score = self.model.evaluate(
-            self.datahandler.X_test,
-            self.datahandler.y_test,
-            batch_size=self.logging.hyperparams["batch_size"],
+            self._make_dataset(
+                self.datahandler.X_test,
+                self.datahandler.y_test,
+                batch_size=self.logging.hyperparams["batch_size"],
+            ),
             verbose=True,
         )
         print("Evaluation done! \n")
@@ -332,11 +353,20 @@ class Classifier:
             Array containing the predictions on the test set.
 
         """
+        # Keras uses a batch size of 32 for prediction by default.
+        batch_size = self.logging.hyperparams.get("batch_size", 32)
+
         self.datahandler.pred_train = self.model.predict(
-            self.datahandler.X_train, verbose=verbose
+            self._make_dataset(
+                self.datahandler.X_train, batch_size=batch_size
+            ),
+            verbose=verbose,
         )
         self.datahandler.pred_test = self.model.predict(
-            self.datahandler.X_test, verbose=verbose
+            self._make_dataset(
+                self.datahandler.X_test, batch_size=batch_size
+            ),
+            verbose=verbose,
         )
 
         if verbose:
@@ -344,6 +374,81 @@ class Classifier:
 
         return self.datahandler.pred_train, self.datahandler.pred_test
 
+    def _make_dataset(self, X, y=None, batch_size=32, shuffle=False):
+        """
+        Build a tf.data input pipeline from feature and label arrays.
+
+        The examples are batched and prefetched so that the
+        preparation of the next batch overlaps with the current
+        training/inference step. The arrays are copied once into
+        the pipeline, so it needs as much memory again as X and y.
+
+        Parameters
+        ----------
+        X : ndarray or list of ndarray
+            Features used as inputs for the Keras model. A list is
+            used for models with several inputs.
+        y : ndarray or list of ndarray, optional
+            Labels. If None, the dataset only yields features.
+            The default is None.
+        batch_size : int, optional
+            Number of examples per batch.
+            The default is 32.
+        shuffle : bool, optional
+            If True, the examples are reshuffled in every epoch, as
+            model.fit does by default for NumPy inputs. Only the
+            indices are shuffled, so this needs no extra copy.
+            The default is False.
+
+        Returns
+        -------
+        dataset : tf.data.Dataset
+            Batched and prefetched dataset.
+
+        """
+        # tf.data treats lists as single tensors, tuples as several.
+        if isinstance(X, list):
+            X = tuple(X)
+        if isinstance(y, list):
+            y = tuple(y)
+        no_of_examples = len(tf.nest.flatten(X)[0])
+
+        if y is None:
+            data = X
+        else:
+            data = (X, y)
+
+        if shuffle:
+            # Shuffle the indices instead of the examples. A shuffle
+            # buffer over the examples would hold another full copy
+            # of the data.
+            tensors = tf.nest.map_structure(tf.convert_to_tensor, data)
+            dataset = (
+                tf.data.Dataset.range(no_of_examples)
+                .shuffle(no_of_examples, reshuffle_each_iteration=True)
+                .batch(batch_size)
+                .map(
+                    lambda idx: tf.nest.map_structure(
+                        lambda t: tf.gather(t, idx), tensors
+                    ),
+                    num_parallel_calls=tf.data.experimental.AUTOTUNE,
+                )
+            )
+        else:
+            dataset = tf.data.Dataset.from_tensor_slices(data).batch(
+                batch_size
+            )
+
+        # Build the batches in parallel on all available cores.
+        options = tf.data.Options()
+        options.experimental_optimization.parallel_batch = True
+        options.experimental_threading.private_threadpool_size = (
+            os.cpu_count()
+        )
+        dataset = dataset.with_options(options)
+
+        return dataset.prefetch(tf.data.experimental.AUTOTUNE)
+
     def predict_classes(self):
         """
         Predict the labels of all spectra in the training/test sets.
@@ -364,23 +469,17 @@ class Classifier:
                 "Regression was chosen as task. "
                 + "No prediction of classes possible!"
             )
-        if self.task == "multi_class_detection":
-            self.datahandler.pred_train_classes = []
-            self.datahandler.pred_test_classes = []
+        labels = np.array(self.datahandler.labels)
 
-            for i, pred in enumerate(self.datahandler.pred_train):
-                arg_max = list(np.where(pred > 0.05)[0])
-                classes = [
-                    self.datahandler.labels[arg] for arg in arg_max
-                ]
-                self.datahandler.pred_train_classes.append(classes)
-
-            for i, pred in enumerate(self.datahandler.pred_test):
-                arg_max = list(np.where(pred > 0.05)[0])
-                classes = [
-                    self.datahandler.labels[arg] for arg in arg_max
-                ]
-                self.datahandler.pred_test_classes.append(classes)
+        if self.task == "multi_class_detection":
+            self.datahandler.pred_train_classes = [
+                labels[classes].tolist()
+                for classes in self.datahandler.pred_train > 0.05
+            ]
+            self.datahandler.pred_test_classes = [
+                labels[classes].tolist()
+                for classes in self.datahandler.pred_test > 0.05
+            ]
 
             print("Class prediction done!")
 
@@ -390,27 +489,12 @@ class Classifier:
             )
 
         else:
-            pred_train_classes = []
-            pred_test_classes = []
-
-            for i, pred in enumerate(clf.datahandler.pred_train):
-                argmax_class = np.argmax(pred, axis=0)
-                pred_train_classes.append(
-                    self.datahandler.labels[argmax_class]
-                )
-
-            for i, pred in enumerate(clf.datahandler.pred_test):
-                argmax_class = np.argmax(pred, axis=0)
-                pred_test_classes.append(
-                    self.datahandler.labels[argmax_class]
-                )
-
-            self.datahandler.pred_train_classes = np.array(
-                pred_train_classes
-            ).reshape(-1, 1)
-            self.datahandler.pred_test_classes = np.array(
-                pred_test_classes
-            ).reshape(-1, 1)
+            self.datahandler.pred_train_classes = labels[
+                np.argmax(self.datahandler.pred_train, axis=1)
+            ].reshape(-1, 1)
+            self.datahandler.pred_test_classes = labels[
+                np.argmax(self.datahandler.pred_test, axis=1)
+            ].reshape(-1, 1)
 
             print("Class prediction done!")
 
@@ -419,29 +503,40 @@ class Classifier:
                 self.datahandler.pred_test_classes,
             )
 
-    def save_model(self):
+    def save_model(self, save_json=False):
         """
         Save the model to the model directory.
         
         The model is saved both as a SavedModel object from Keras as 
-        well as a JSON file containing the model parameters and the 
-        weights serialized to HDF5.
+        well as the weights serialized to HDF5. The SavedModel already
+        contains the architecture, so the JSON file with the model
+        parameters is only written on request.
+
+        Parameters
+        ----------
+        save_json : bool, optional
+            If True, the model architecture is also saved to a JSON
+            file.
+            The default is False.
 
         Returns
         -------
         None.
 
         """
-        model_file_name = os.path.join(
-            self.logging.model_dir, "model.json"
-        )
+        if save_json:
+            model_file_name = os.path.join(
+                self.logging.model_dir, "model.json"
+            )
+            model_json = self.model.to_json()
+            with open(
+                model_file_name, "w", encoding="utf-8"
+            ) as json_file:
+                json_file.write(model_json)
+
         weights_file_name = os.path.join(
             self.logging.model_dir, "weights.h5"
         )
-
-        model_json = self.model.to_json()
-        with open(model_file_name, "w", encoding="utf-8") as json_file:
-            json_file.write(model_json)
         # serialize weights to HDF5
         self.model.save_weights(weights_file_name)
         self.model.save(self.logging.model_dir)
@@ -483,20 +578,10 @@ class Classifier:
         # Add the current model to the custom_objects dict. This is
         # done to ensure the load_model method from Keras works
         # properly.
-        import inspect
-
-        custom_objects = {}
+        custom_objects = dict(MODELS_CUSTOM_OBJECTS)
         custom_objects[
             str(type(self.model).__name__)
         ] = self.model.__class__
-        for name, obj in inspect.getmembers(models):
-            if inspect.isclass(obj):
-                if obj.__module__.startswith(
-                    "xpsdeeplearning.network.models"
-                ):
-                    custom_objects[
-                        obj.__module__ + "." + obj.__name__
-                    ] = obj
 
         # Load from file.
         loaded_model = load_model(
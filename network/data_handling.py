@@ -7,13 +7,11 @@ Created on Tue Feb 23 15:29:41 2021.
 
 import numpy as np
 import h5py
-from sklearn.utils import shuffle
 
 import seaborn as sns
-import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 
-from .utils import ClassDistribution, SpectraPlot
+from .utils import ClassDistribution, SpectraPlot, create_figure
 
 #%%
 class DataHandler:
@@ -98,7 +96,15 @@ class DataHandler:
         self.train_val_split = train_val_split
         self.no_of_examples = no_of_examples
 
-        with h5py.File(input_filepath, "r") as hf:
+        # A large chunk cache keeps every decompressed chunk of the
+        # selected slab in memory while it is read.
+        with h5py.File(
+            input_filepath,
+            "r",
+            rdcc_nbytes=256 * 1024 ** 2,
+            rdcc_nslots=1000003,
+            rdcc_w0=0.75,
+        ) as hf:
             try:
                 self.energies = hf["energies"][:]
             except KeyError:
@@ -140,13 +146,26 @@ class DataHandler:
                 )
                 raise type(e)(error_msg)
 
-            X = hf["X"][r : r + self.no_of_examples, :, :]
-            X = X.astype(np.float)
-            y = hf["y"][r : r + self.no_of_examples, :]
+            # Read the slab directly into the output array, without
+            # an intermediate copy for the type conversion. Single
+            # precision is what the Keras models compute in anyway.
+            X = np.empty(
+                (self.no_of_examples,) + hf["X"].shape[1:],
+                dtype=np.float32,
+            )
+            hf["X"].read_direct(
+                X, source_sel=np.s_[r : r + self.no_of_examples]
+            )
+            y = hf["y"][r : r + self.no_of_examples, :].astype(
+                np.float32, copy=False
+            )
 
             if not self.intensity_only:
                 new_energies = np.tile(
-                    np.reshape(np.array(self.energies), (-1, 1)),
+                    np.reshape(
+                        np.array(self.energies, dtype=np.float32),
+                        (-1, 1),
+                    ),
                     (X.shape[0], 1, 1),
                 )
                 X = np.dstack((new_energies, X))
@@ -179,7 +198,7 @@ class DataHandler:
                         scatterer,
                         distance,
                         pressure,
-                    ) = shuffle(
+                    ) = self._shuffle(
                         X,
                         y,
                         shift_x,
@@ -203,9 +222,13 @@ class DataHandler:
 
                 else:
                     # Shuffle all arrays together
-                    self.X, self.y, shift_x, noise, fwhm = shuffle(
-                        X, y, shift_x, noise, fwhm
-                    )
+                    (
+                        self.X,
+                        self.y,
+                        shift_x,
+                        noise,
+                        fwhm,
+                    ) = self._shuffle(X, y, shift_x, noise, fwhm)
                     sim_values = {
                         "shift_x": shift_x,
                         "noise": noise,
@@ -256,7 +279,7 @@ class DataHandler:
                 names = np.reshape(np.array(names_load_list), (-1, 1))
 
                 # Shuffle all arrays together
-                self.X, self.y, self.names = shuffle(X, y, names)
+                self.X, self.y, self.names = self._shuffle(X, y, names)
 
                 # Split into train, val and test sets
                 (
@@ -296,7 +319,7 @@ class DataHandler:
             # the dataset, just load the X and y arrays.
             else:
                 # Shuffle X and y together
-                self.X, self.y = shuffle(X, y)
+                self.X, self.y = self._shuffle(X, y)
                 # Split into train, val and test sets
                 (
                     self.X_train,
@@ -339,6 +362,32 @@ class DataHandler:
 
         return loaded_data
 
+    def _shuffle(self, *arrays):
+        """
+        Shuffle multiple arrays in place along their first axis.
+
+        All arrays are permuted in the same way by replaying the same
+        random state for each of them. Unlike sklearn.utils.shuffle,
+        no copies of the arrays are made.
+
+        Parameters
+        ----------
+        *arrays : ndarrays
+            Arrays with the same length of their first axis.
+
+        Returns
+        -------
+        arrays : tuple
+            The shuffled input arrays.
+
+        """
+        state = np.random.get_state()
+        for array in arrays:
+            np.random.set_state(state)
+            np.random.shuffle(array)
+
+        return arrays
+
     def _split_test_val_train(self, X, y, **kwargs):
         """
         Split multiple numpy arrays into train, val, and test sets.
@@ -627,15 +676,18 @@ class DataHandler:
 
         """
         print("Calculating loss for each example...")
-        self.losses_train = [
-            loss_func(self.y_train[i], self.pred_train[i]).numpy()
-            for i in range(self.y_train.shape[0])
-        ]
-
-        self.losses_test = [
-            loss_func(self.y_test[i], self.pred_test[i]).numpy()
-            for i in range(self.y_test.shape[0])
-        ]
+        # Calling a keras Loss object reduces the losses over the
+        # batch, so its call method is used to get the unreduced loss
+        # of each example. Plain loss functions already return one
+        # value per example.
+        per_example_loss = getattr(loss_func, "call", loss_func)
+
+        self.losses_train = np.asarray(
+            per_example_loss(self.y_train, self.pred_train)
+        )
+        self.losses_test = np.asarray(
+            per_example_loss(self.y_test, self.pred_test)
+        )
         print("Done!")
 
     def plot_spectra(
@@ -663,30 +715,16 @@ class DataHandler:
         None.
 
         """
-        data = []
-        texts = []
-
         X, y = self._select_dataset(dataset)
 
-        for i in range(no_of_spectra):
-            index = indices[i]
-            if self.intensity_only:
-                new_energies = np.reshape(
-                    np.array(self.energies), (-1, 1)
-                )
-                data.append(np.hstack((new_energies, X[index])))
-            else:
-                data.append(X[index])
+        indices = indices[:no_of_spectra]
+        data = self._stack_spectra(X, indices)
 
-            text = self.write_text_for_spectrum(
-                dataset=dataset,
-                index=index,
-                with_prediction=with_prediction,
-            )
-
-            texts.append(text)
-
-        data = np.array(data)
+        texts = self._write_texts_for_spectra(
+            dataset=dataset,
+            indices=indices,
+            with_prediction=with_prediction,
+        )
 
         graphic = SpectraPlot(data=data, annots=texts)
         fig, axs = graphic.plot()
@@ -717,10 +755,9 @@ class DataHandler:
         """
         X, y = self._select_dataset(dataset)
 
-        indices = []
-        for i in range(no_of_spectra):
-            r = np.random.randint(0, X.shape[0])
-            indices.append(r)
+        indices = np.random.randint(
+            0, X.shape[0], size=no_of_spectra
+        ).tolist()
 
         self.plot_spectra(
             no_of_spectra=no_of_spectra,
@@ -761,79 +798,64 @@ class DataHandler:
         X, y = self._select_dataset("test")
         pred, losses = self._get_predictions("test")
 
+        losses = np.asarray(losses, dtype=float)
+        single = np.count_nonzero(y == 0.0, axis=1) == 3
+
         if kind == "all":
-            indices = [
-                j[1]
-                for j in sorted(
-                    [
-                        (x, i)
-                        for (i, x) in enumerate(losses)
-                        if x >= threshold
-                    ],
-                    reverse=True,
-                )
-            ]
-            len_all = y.shape[0]
+            in_subset = np.ones(y.shape[0], dtype=bool)
             print_statement = ""
 
         elif kind == "single":
-            indices = [
-                j[1]
-                for j in sorted(
-                    [
-                        (x, i)
-                        for (i, x) in enumerate(losses)
-                        if (
-                            len(np.where(y[i] == 0.0)[0]) == 3
-                            and x >= threshold
-                        )
-                    ],
-                    reverse=True,
-                )
-            ]
-            len_all = len(
-                [
-                    i
-                    for (i, x) in enumerate(losses)
-                    if (len(np.where(y[i] == 0.0)[0]) == 3)
-                ]
-            )
+            in_subset = single
             print_statement = "with a single species "
 
         elif kind == "linear_comb":
-            indices = [
-                j[1]
-                for j in sorted(
-                    [
-                        (x, i)
-                        for (i, x) in enumerate(losses)
-                        if (
-                            len(np.where(y[i] == 0.0)[0]) != 3
-                            and x >= threshold
-                        )
-                    ],
-                    reverse=True,
-                )
-            ]
-            len_all = len(
-                [
-                    i
-                    for (i, x) in enumerate(losses)
-                    if (len(np.where(y[i] == 0.0)[0]) != 3)
-                ]
-            )
+            in_subset = ~single
             print_statement = "with multiple species "
 
+        len_all = int(np.count_nonzero(in_subset))
+        candidates = np.flatnonzero(in_subset & (losses >= threshold))
+        no_of_candidates = len(candidates)
+
+        # Only select the k spectra to be plotted instead of sorting
+        # all candidates. With a threshold, these are the spectra
+        # with the lowest losses above the threshold (ties: lowest
+        # index), otherwise the ones with the highest losses (ties:
+        # highest index).
+        k = min(no_of_spectra, no_of_candidates)
+        candidate_losses = losses[candidates]
+        if k == 0:
+            selected = candidates[:0]
+        elif threshold > 0.0:
+            kth_loss = np.partition(candidate_losses, k - 1)[k - 1]
+            inside = candidates[candidate_losses < kth_loss]
+            ties = candidates[candidate_losses == kth_loss]
+            selected = np.concatenate(
+                (inside, ties[: k - len(inside)])
+            )
+        else:
+            kth_loss = np.partition(candidate_losses, -k)[-k]
+            inside = candidates[candidate_losses > kth_loss]
+            ties = candidates[candidate_losses == kth_loss][::-1]
+            selected = np.concatenate(
+                (inside, ties[: k - len(inside)])
+            )
+
+        # Order by decreasing loss (ties by decreasing index).
+        indices = selected[
+            np.lexsort((-selected, -losses[selected]))
+        ].tolist()
+
         if threshold > 0.0:
             print(
                 "{0} of {1} test samples ({2}%) {3}have a mean ".format(
-                    str(len(indices)),
+                    str(no_of_candidates),
                     str(len_all),
                     str(
                         100
                         * (
                             np.around(
-                                len(indices) / len_all, decimals=3
+                                no_of_candidates / len_all, decimals=3
                             )
                         )
                     ),
@@ -843,10 +865,6 @@ class DataHandler:
                     str(threshold)
                 )
             )
-            indices = indices[-no_of_spectra:]
-
-        else:
-            indices = indices[:no_of_spectra]
 
         self.plot_spectra(
             no_of_spectra=no_of_spectra,
@@ -866,17 +884,13 @@ class DataHandler:
         None.
 
         """
-        data = []
         texts = []
 
-        wrong_pred_args = []
-
-        for i in range(self.pred_test.shape[0]):
-            argmax_class_true = np.argmax(self.y_test[i, :], axis=0)
-            argmax_class_pred = np.argmax(self.pred_test[i, :], axis=0)
-
-        if argmax_class_true != argmax_class_pred:
-            wrong_pred_args.append(i)
+        argmax_class_true = np.argmax(self.y_test, axis=1)
+        argmax_class_pred = np.argmax(self.pred_test, axis=1)
+        wrong_pred_args = np.flatnonzero(
+            argmax_class_true != argmax_class_pred
+        ).tolist()
         no_of_wrong_pred = len(wrong_pred_args)
         print(
             "No. of wrong predictions on the test data: "
@@ -884,27 +898,38 @@ class DataHandler:
         )
 
         if no_of_wrong_pred > 0:
-            for i in range(no_of_wrong_pred):
-                index = wrong_pred_args[i]
-
-                real_y = "Real: " + str(self.y_test[index]) + "\n"
-                # Round prediction and sum to 1
-                tmp_array = np.around(self.pred_test[index], decimals=4)
-                # row_sums = tmp_array.sum()
-                # tmp_array = tmp_array / row_sums
-                # tmp_array = np.around(tmp_array, decimals=2)
-                pred_y = "Prediction: " + str(tmp_array) + "\n"
-                pred_label = (
-                    "Predicted label: "
-                    + str(self.pred_test_classes[index, 0])
+            # Gather everything needed for the annotations at once.
+            real_ys = self.y_test[wrong_pred_args]
+            real_labels = np.array(self.labels)[
+                argmax_class_true[wrong_pred_args]
+            ]
+            pred_labels = self.pred_test_classes[wrong_pred_args, 0]
+            rounded_preds = np.around(
+                self.pred_test[wrong_pred_args], decimals=4
+            )
+            data = self._stack_spectra(self.X_test, wrong_pred_args)
+
+            for index, real_y, pred, real_label, pred_label in zip(
+                wrong_pred_args,
+                real_ys,
+                rounded_preds,
+                real_labels,
+                pred_labels,
+            ):
+                text = (
+                    "Real: "
+                    + str(real_y)
+                    + "\n"
+                    + "Prediction: "
+                    + str(pred)
+                    + "\n"
+                    + "Real label: "
+                    + str(real_label)
+                    + "\n"
+                    + "Predicted label: "
+                    + str(pred_label)
                     + "\n"
                 )
-                labels = self.y_test[index]
-                for j, value in enumerate(labels):
-                    if value == 1:
-                        label = str(self.labels[j])
-                        label = "Real label: " + label + "\n"
-                text = real_y + pred_y + label + pred_label
                 try:
                     sim = self._write_sim_text(
                         dataset="test", index=index
@@ -922,8 +947,6 @@ class DataHandler:
 
                 texts.append(text)
 
-            data = np.array(data)
-
             graphic = SpectraPlot(data=data, annots=texts)
             fig, axs = graphic.plot()
 
@@ -939,36 +962,23 @@ class DataHandler:
             )
             no_of_spectra = y.shape[0]
 
-        fig, axs = plt.subplots(
-            nrows=no_of_spectra,
-            ncols=5,
-            figsize=(22, 5 * no_of_spectra),
-        )
+        fig = create_figure(figsize=(22, 5 * no_of_spectra))
+        axs = fig.subplots(nrows=no_of_spectra, ncols=5, squeeze=False)
 
         max_y = np.max([np.float(np.max(y)), np.max(prob_preds)])
+        max_energy = np.max(self.energies)
+        min_energy = np.min(self.energies)
 
-        random_numbers = []
-        for i in range(no_of_spectra):
-            ax0 = axs[i, 0]
-            ax1 = axs[i, 1]
-            ax2 = axs[i, 2]
-            ax3 = axs[i, 3]
-            ax4 = axs[i, 4]
-
-            r = np.random.randint(0, X.shape[0])
-
-            while r in random_numbers:
-                r = np.random.randint(0, X.shape[0])
-            random_numbers.append(r)
-
+        # Sample without replacement to prevent repeating spectra.
+        random_numbers = np.random.choice(
+            X.shape[0], size=no_of_spectra, replace=False
+        )
+        for (ax0, ax1, ax2, ax3, ax4), r in zip(axs, random_numbers):
             if len(X.shape) == 4:
                 ax0.imshow(X[r, :, :, 0], cmap="gist_gray")
             elif len(X.shape) == 3:
                 ax0.plot(self.energies, self.X[r])
-                ax0.invert_xaxis()
-                ax0.set_xlim(
-                    np.max(self.energies), np.min(self.energies)
-                )
+                ax0.set_xlim(max_energy, min_energy)
                 ax0.set_xlabel("Binding energy (eV)")
                 ax0.set_ylabel("Intensity (arb. units)")
                 annot = self.write_text_for_spectrum(
@@ -1036,6 +1046,36 @@ class DataHandler:
 
         return fig
 
+    def _stack_spectra(self, X, indices):
+        """
+        Collect the spectra at the given indices for plotting.
+
+        If only the intensities are stored in X, the energy axis is
+        added as the first channel of each spectrum.
+
+        Parameters
+        ----------
+        X : ndarray
+            Spectra of one data set.
+        indices : list
+            Indices of the spectra to plot.
+
+        Returns
+        -------
+        data : ndarray
+            Array of shape (len(indices), no. of energies, 2) if
+            intensity_only, else X[indices].
+
+        """
+        spectra = X[indices]
+        if not self.intensity_only:
+            return spectra
+
+        energies = np.reshape(np.array(self.energies), (1, -1, 1))
+        energies = np.broadcast_to(energies, spectra.shape[:2] + (1,))
+
+        return np.concatenate((energies, spectra), axis=2)
+
     def _select_dataset(self, dataset_name):
         """
         Select a data set (for plotting).
@@ -1112,43 +1152,81 @@ class DataHandler:
         text : TYPE
             DESCRIPTION.
 
+        """
+        return self._write_texts_for_spectra(
+            dataset=dataset,
+            indices=[index],
+            with_prediction=with_prediction,
+        )[0]
+
+    def _write_texts_for_spectra(
+        self, dataset, indices, with_prediction=True
+    ):
+        """
+        Create the annotations for the plots of several spectra.
+
+        The labels, predictions and losses of all spectra are rounded
+        at once before the texts are assembled.
+
+        Parameters
+        ----------
+        dataset : str
+            Either 'train', 'val', or 'test'.
+        indices : list
+            Indices of the spectra in the data set.
+        with_prediction : bool, optional
+            If True, the predictions and losses are added to the
+            texts. The default is True.
+
+        Returns
+        -------
+        texts : list
+            One annotation per index.
+
         """
         X, y = self._select_dataset(dataset)
 
-        label = str(np.around(y[index], decimals=3))
-        text = "Real: " + label + "\n"
+        labels = np.around(y[indices], decimals=3)
 
         if with_prediction:
             pred, losses = self._get_predictions(dataset)
-
             # Round prediction and sum to 1
-            tmp_array = np.around(pred[index], decimals=4)
-            # row_sums = tmp_array.sum()
-            # tmp_array = tmp_array / row_sums
-            # tmp_array = np.around(tmp_array, decimals=3)
-            pred_text = "Prediction: " + str(list(tmp_array)) + "\n"
-            text += pred_text
+            preds = np.around(pred[indices], decimals=4)
+            # row_sums = preds.sum(axis=1, keepdims=True)
+            # preds = preds / row_sums
+            # preds = np.around(preds, decimals=3)
+            # Convert to plain floats in one go (rounded again in
+            # double precision so that e.g. 0.0835 prints as such).
+            preds = np.around(preds.astype(float), decimals=4).tolist()
+            losses = np.around(np.asarray(losses)[indices], decimals=3)
 
-        try:
-            text += self._write_sim_text(dataset=dataset, index=index)
-        except AttributeError:
-            pass
-        try:
-            text += self._write_measured_text(
-                dataset=dataset, index=index
-            )
-        except AttributeError:
-            pass
+        texts = []
+        for i, index in enumerate(indices):
+            text = "Real: " + str(labels[i]) + "\n"
 
-        if with_prediction:
-            loss_text = (
-                "\n"
-                + "Loss: "
-                + str(np.around(losses[index], decimals=3))
-            )
-            text += loss_text
+            if with_prediction:
+                pred_text = "Prediction: " + str(preds[i]) + "\n"
+                text += pred_text
+
+            try:
+                text += self._write_sim_text(
+                    dataset=dataset, index=index
+                )
+            except AttributeError:
+                pass
+            try:
+                text += self._write_measured_text(
+                    dataset=dataset, index=index
+                )
+            except AttributeError:
+                pass
+
+            if with_prediction:
+                text += "\n" + "Loss: " + str(losses[i])
+
+            texts.append(text)
 
-        return text
+        return texts
 
     def _write_sim_text(self, dataset, index):
         """
@@ -6,9 +6,9 @@ Created on Tue Feb 23 15:29:41 2021.
 """
 import os
 import json
-import csv
 import shutil
 
+import pandas as pd
 import tensorflow as tf
 from tensorflow.keras import callbacks
 
@@ -93,30 +93,19 @@ class ExperimentLogging:
         None.
 
         """
-        model_split = str(self.model_dir.split("runs")[1])
-        log_split = str(self.log_dir.split("runs")[1])
-        fig_split = str(self.fig_dir.split("runs")[1])
-
-        if os.path.isdir(self.model_dir) is False:
-            os.makedirs(self.model_dir)
-            if os.path.isdir(self.model_dir):
-                print("Model folder created at " + model_split)
-        else:
-            print("Model folder was already at " + model_split)
-
-        if os.path.isdir(self.log_dir) is False:
-            os.makedirs(self.log_dir)
-            if os.path.isdir(self.log_dir):
-                print("Logs folder created at " + log_split)
-        else:
-            print("Logs folder was already at " + log_split)
-
-        if os.path.isdir(self.fig_dir) is False:
-            os.makedirs(self.fig_dir)
-            if os.path.isdir(self.fig_dir):
-                print("Figures folder created at " + fig_split)
-        else:
-            print("Figures folder was already at " + fig_split)
+        runs_dir = os.path.dirname(self.root_dir)
+
+        for name, folder in (
+            ("Model", self.model_dir),
+            ("Logs", self.log_dir),
+            ("Figures", self.fig_dir),
+        ):
+            rel_path = os.sep + os.path.relpath(folder, runs_dir)
+            try:
+                os.makedirs(folder)
+                print(name + " folder created at " + rel_path)
+            except FileExistsError:
+                print(name + " folder was already at " + rel_path)
 
     def activate_cbs(
         self,
@@ -190,10 +179,11 @@ class ExperimentLogging:
         epochs = 0
 
         try:
-            with open(csv_file, newline="") as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    epochs += 1
+            with open(csv_file, "rb") as csvfile:
+                # Count the non-empty lines without parsing them. The
+                # first line is the header.
+                no_of_lines = sum(1 for line in csvfile if line.strip())
+            epochs = max(no_of_lines - 1, 0)
         except FileNotFoundError:
             pass
 
@@ -215,14 +205,9 @@ class ExperimentLogging:
 
         history = {}
         try:
-            with open(csv_file, newline="") as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    for key, item in row.items():
-                        if key not in history.keys():
-                            history[key] = []
-                        history[key].append(float(item))
-        except FileNotFoundError:
+            df = pd.read_csv(csv_file, dtype=float)
+            history = {key: df[key].tolist() for key in df.columns}
+        except (FileNotFoundError, pd.errors.EmptyDataError):
             pass
 
         return history
@@ -338,7 +323,7 @@ class CustomModelCheckpoint(callbacks.ModelCheckpoint):
         """
         Saves the model.
         
-        Saves the model to JSON and the weights to HDF5 as well.
+        Saves the weights to HDF5 as well.
         
         Parameters
         ----------
@@ -393,16 +378,6 @@ class CustomModelCheckpoint(callbacks.ModelCheckpoint):
                                     options=self._options,
                                 )
                             else:
-                                with open(
-                                    os.path.join(
-                                        filepath, "model.json"
-                                    ),
-                                    "w",
-                                    encoding="utf-8",
-                                ) as json_file:
-                                    json_file.write(
-                                        self.model.to_json()
-                                    )
                                 self.model.save_weights(
                                     os.path.join(filepath, "weights.h5")
                                 )
@@ -434,12 +409,6 @@ class CustomModelCheckpoint(callbacks.ModelCheckpoint):
                             options=self._options,
                         )
                     else:
-                        with open(
-                            os.path.join(filepath, "model.json"),
-                            "w",
-                            encoding="utf-8",
-                        ) as json_file:
-                            json_file.write(self.model.to_json())
                         self.model.save_weights(
                             os.path.join(filepath, "weights.h5")
                         )
@@ -46,6 +46,8 @@ class EmptyModel(models.Model):
             Shape of the labels of the training data set.
         no_of_inputs : int, optional
             Number of times the input shall be used in the Model.
+            All branches share the same keras.Input, so the data is
+            only fed to the model once.
             The default is 1.
         name : str, optional
             Name of the model.
@@ -5,8 +5,14 @@ Created on Tue Nov 3 12:37:52 2020.
 @author: pielsticker
 """
 import numpy as np
+import tensorflow as tf
 import talos
 import os
+import glob
+import re
+import bisect
+import functools
+from collections.abc import Sequence
 import pandas as pd
 from matplotlib import pyplot as plt
 from matplotlib import ticker
@@ -45,6 +51,13 @@ class Hyperoptimization:
 
         self.scans = []
         self.full_data = pd.DataFrame()
+        # Results already read from disk, with their modification times.
+        self._result_cache = {}
+        # Model factory for hyper_opt, bound once per scan in
+        # scan_parameter_space.
+        self._build_model = None
+        # Tensors of the scan data, keyed by the id of the arrays.
+        self._scan_tensors = {}
 
         if os.path.isdir(self.test_dir) is False:
             os.makedirs(self.test_dir)
@@ -90,7 +103,11 @@ class Hyperoptimization:
         """
         Instantiate, compile and call model.
         
-        Used in the Talos Scan.
+        Used in the Talos Scan. The data is fed through
+        Classifier._make_dataset. During scan_parameter_space, the
+        scan arrays are converted to tensors only once and reused in
+        every round. Called on its own, hyper_opt copies the arrays
+        once into its input pipeline.
 
         Parameters
         ----------
@@ -124,29 +141,79 @@ class Hyperoptimization:
             Keras model.
 
         """
-        model_class = type(self.clf.model)
-        model = model_class(
-            self.clf.datahandler.input_shape,
-            self.clf.datahandler.num_classes,
-            params,
-        )
+        build_model = self._build_model
+        if build_model is None:
+            build_model = self._get_model_factory()
+        model = build_model(params)
         model.compile(
             loss=params["loss_function"](),
             optimizer=params["optimizer"](params["learning_rate"]),
         )
 
+        x_train, y_train, x_val, y_val = self._use_scan_tensors(
+            [x_train, y_train, x_val, y_val]
+        )
+
+        # Same input pipeline as in Classifier.train, so that the
+        # batches are prepared in parallel with the training steps.
         out = model.fit(
-            x=x_train,
-            y=y_train,
-            validation_data=(x_val, y_val),
+            self.clf._make_dataset(
+                x_train,
+                y_train,
+                batch_size=params["batch_size"],
+                shuffle=True,
+            ),
+            validation_data=self.clf._make_dataset(
+                x_val, y_val, batch_size=params["batch_size"]
+            ),
             epochs=params["epochs"],
-            batch_size=params["batch_size"],
             verbose=0,
         )
 
         return out, model
 
-    def scan_parameter_space(self, params, **kwargs):
+    def _use_scan_tensors(self, data):
+        """
+        Replace the arrays of the running scan by their tensors.
+
+        Parameters
+        ----------
+        data : list
+            Arrays (or lists of arrays) passed to hyper_opt by Talos.
+
+        Returns
+        -------
+        list
+            data, with every array that was converted in
+            scan_parameter_space replaced by its tensor.
+
+        """
+
+        def lookup(array):
+            original, tensor = self._scan_tensors.get(
+                id(array), (None, None)
+            )
+            return tensor if original is array else array
+
+        return tf.nest.map_structure(lookup, data)
+
+    def _get_model_factory(self):
+        """
+        Bind the model class of the classifier to the data shapes.
+
+        Returns
+        -------
+        functools.partial
+            Callable that builds a new model from a params dict.
+
+        """
+        return functools.partial(
+            type(self.clf.model),
+            self.clf.datahandler.input_shape,
+            self.clf.datahandler.num_classes,
+        )
+
+    def scan_parameter_space(self, params, jit_compile=False, **kwargs):
         """
         Scan the parameter space provided in the params dictionary.
         
@@ -156,9 +223,17 @@ class Hyperoptimization:
         ----------
         params : dict
             Parameter space to be scanned.
+        jit_compile : bool, optional
+            If True, the models in all rounds are compiled with XLA
+            (auto-clustering), which fuses the operations of the
+            training step. The previous setting is restored after
+            the scan.
+            The default is False.
         **kwargs : str
             Limiter arguments in Talos (see Talos doc), e.g.
-            'fraction_limit', 'round_limit', 'time_limit' 
+            'fraction_limit', 'round_limit', 'time_limit', or
+            'fp16_weights' for storing the weights as float16
+            (see Scan).
 
         Returns
         -------
@@ -170,13 +245,24 @@ class Hyperoptimization:
 
         # Calculate the number of the scan according to the files
         # already in the test directory.
-        filenames = next(os.walk(self.test_dir))[2]
-        number = 0
-        for filename in filenames:
-            if filename.startswith("test_log") and filename.endswith(
-                ".pkl"
-            ):
-                number += 1
+        number = len(self._get_result_files())
+
+        # The model class and the data shapes are the same in all
+        # rounds, so they are looked up only once.
+        self._build_model = self._get_model_factory()
+
+        # Talos passes the same arrays to every round. Convert them to
+        # tensors once, so that the rounds do not copy them again.
+        datahandler = self.clf.datahandler
+        self._scan_tensors = {
+            id(array): (array, tf.convert_to_tensor(array))
+            for array in (
+                datahandler.X_train,
+                datahandler.y_train,
+                datahandler.X_val,
+                datahandler.y_val,
+            )
+        }
 
         # Initialize Scan object (based on talos.Scan)
         # start runtime
@@ -197,6 +283,8 @@ class Hyperoptimization:
         )
         self.scans.append(scan)
 
+        jit_before = tf.config.optimizer.get_jit()
+        tf.config.optimizer.set_jit(jit_compile)
         try:
             from talos.scan.scan_run import scan_run
 
@@ -218,6 +306,10 @@ class Hyperoptimization:
                 ).format(scan.data.shape[0])
             )
 
+        finally:
+            tf.config.optimizer.set_jit(jit_before)
+            self._scan_tensors = {}
+
         scan.deploy()
 
         # Combine the new data with the previous results.
@@ -241,17 +333,11 @@ class Hyperoptimization:
 
         """
         scans = []
-        filenames = [
-            filename
-            for filename in next(os.walk(self.test_dir))[2]
-            if (
-                filename.startswith("test_log")
-                and filename.endswith("pkl")
-            )
-        ]
-
-        for filename in filenames:
-            scan_number = int(filename.split(".")[0][-1])
+        for results_file in self._get_result_files():
+            # The scan number is given by all trailing digits of the
+            # file name (e.g. 12 in test_log12.pkl).
+            stem = os.path.splitext(os.path.basename(results_file))[0]
+            scan_number = int(re.search(r"\d+$", stem).group())
             restored_scan = RestoredScan(self.test_dir, scan_number)
             scans.append(restored_scan)
 
@@ -272,19 +358,41 @@ class Hyperoptimization:
             A Dataframe containing the results from all scan objects.
 
         """
-        filenames = next(os.walk(self.test_dir))[2]
-        full_data = pd.DataFrame()
-        for filename in filenames:
-            if filename.startswith("test_log") and filename.endswith(
-                "pkl"
-            ):
-                results_file = os.path.join(self.test_dir, filename)
-                new_df = pd.read_pickle(results_file)
-                full_data = pd.concat(
-                    [full_data, new_df], ignore_index=True
-                )
+        # Only read result files that are new or were changed since
+        # the last call. Concatenate once at the end instead of
+        # growing the DataFrame for each file.
+        frames = []
+        for results_file in self._get_result_files():
+            mtime = os.path.getmtime(results_file)
+            cached = self._result_cache.get(results_file)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, pd.read_pickle(results_file))
+                self._result_cache[results_file] = cached
+            frames.append(cached[1])
+        if not frames:
+            return pd.DataFrame()
 
-        return full_data
+        return pd.concat(frames, ignore_index=True)
+
+    def _get_result_files(self):
+        """
+        List the result files of all scans in the test directory.
+
+        Returns
+        -------
+        list
+            Paths of all test_log*.pkl files.
+
+        """
+        pattern = os.path.join(
+            glob.escape(self.test_dir), "test_log*.pkl"
+        )
+
+        return [
+            results_file
+            for results_file in glob.glob(pattern)
+            if os.path.isfile(results_file)
+        ]
 
     def save_full_data(self):
         """
@@ -298,25 +406,28 @@ class Hyperoptimization:
         new_csv_filepath = os.path.join(self.test_dir, "all_tests.csv")
         new_pkl_filepath = os.path.join(self.test_dir, "all_tests.pkl")
 
-        np.savetxt(
-            new_csv_filepath, self.full_data, fmt="%s", delimiter=","
+        self.full_data.to_csv(
+            new_csv_filepath, header=False, index=False
         )
 
         self.full_data.to_pickle(new_pkl_filepath)
 
     def _get_all_weights(self):
         """
-        Combine the weights from all scans into one numpy array.
+        Combine the weights from all scans into one sequence.
+
+        The weights of restored scans are only loaded from disk
+        when a round is accessed.
 
         Returns
         -------
-        array
-            Concatenated weights of all scans.
+        ChainedWeights
+            Weights of all rounds of all scans, indexed by round ID.
 
         """
         weights = [scan.saved_weights for scan in self.scans]
 
-        return np.concatenate(weights)
+        return ChainedWeights(weights)
 
     def initialize_analyzer(self):
         """
@@ -399,7 +510,12 @@ class Hyperoptimization:
         )
 
         self.clf.model._name = "Model_{0}".format(model_id)
-        self.clf.model.set_weights(self.all_weights[model_id])
+        # Weights stored as float16 (see Scan) are cast back here.
+        weights = [
+            w.astype(np.float32) if w.dtype == np.float16 else w
+            for w in self.all_weights[model_id]
+        ]
+        self.clf.model.set_weights(weights)
 
 
 class Scan(talos.Scan):
@@ -433,13 +549,19 @@ class Scan(talos.Scan):
         clear_session=True,
         save_weights=True,
         number=0,
+        fp16_weights=False,
     ):
         """
         Overwrite __init__ method taken from talos.Scan.
         
         In comparison to original talos.Scan, scan_round is
         not run on implementation (see talos docs),
+
+        If fp16_weights is True, the float32 weights of each round
+        are stored as float16 in deploy, which halves the size of
+        the scan archive. They are cast back when a model is loaded.
         """
+        self.fp16_weights = fp16_weights
         super(Scan, self).__init__(
             x=x,
             y=y,
@@ -495,7 +617,9 @@ class Scan(talos.Scan):
 
         detail_file = os.path.join(scan_dir, "details.txt")
         param_file = os.path.join(scan_dir, "params")
-        weights_file = os.path.join(scan_dir, "saved_weights")
+        weights_dir = os.path.join(scan_dir, "saved_weights")
+        if os.path.isdir(weights_dir) is False:
+            os.makedirs(weights_dir)
         round_file = os.path.join(scan_dir, "round_log.csv")
         model_file = os.path.join(scan_dir, "saved_models.txt")
 
@@ -503,8 +627,18 @@ class Scan(talos.Scan):
         self.details.to_csv(detail_file)
         # Save all parameters.
         np.save(param_file, self.params)
-        # Save the weights of each round in array format.
-        np.save(weights_file, self.saved_weights)
+        # Save the weights of each round to a separate file so that
+        # single rounds can be restored without loading all others.
+        for i, round_weights in enumerate(self.saved_weights):
+            if self.fp16_weights:
+                round_weights = [
+                    w.astype(np.float16) if w.dtype == np.float32 else w
+                    for w in round_weights
+                ]
+            np.savez(
+                os.path.join(weights_dir, "round_{}.npz".format(i)),
+                *round_weights
+            )
 
         # Save information about the round history.
         with open(round_file, "w") as roundfile:
@@ -572,6 +706,7 @@ class RestoredScan:
         scan_folder = "scan" + str(self.number)
         scan_dir = os.path.join(folder, scan_folder)
         detail_file = os.path.join(scan_dir, "details.txt")
+        weights_dir = os.path.join(scan_dir, "saved_weights")
         weights_file = os.path.join(scan_dir, "saved_weights.npy")
         round_file = os.path.join(scan_dir, "round_log.csv")
         model_file = os.path.join(scan_dir, "saved_models.txt")
@@ -580,7 +715,13 @@ class RestoredScan:
             detail_file, header=None, squeeze=True, index_col=0
         )
 
-        self.saved_weights = np.load(weights_file, allow_pickle=True)
+        if os.path.isdir(weights_dir):
+            self.saved_weights = SavedWeights(weights_dir)
+        else:
+            # Scans saved before the weights were split by round.
+            self.saved_weights = np.load(
+                weights_file, allow_pickle=True
+            )
 
         round_data = pd.read_csv(round_file)
         self.learning_entropy = pd.DataFrame(round_data["loss"])
@@ -589,16 +730,114 @@ class RestoredScan:
 
         self.round_history = list(round_data["round_history"])
 
-        self.saved_models = []
         with open(model_file, "r") as modelfile:
-            for line in modelfile.readlines():
-                self.saved_models.append(line[:-1])
+            self.saved_models = modelfile.read().splitlines()
 
         print(
             "Previous data for Scan {} was loaded!".format(self.number)
         )
 
 
+class SavedWeights(Sequence):
+    """Weights of all rounds of a scan, loaded from disk on access."""
+
+    def __init__(self, weights_dir):
+        """
+        Collect the files with the weights of each round.
+
+        Parameters
+        ----------
+        weights_dir : str
+            Directory containing one round_<i>.npz file per round.
+
+        Returns
+        -------
+        None.
+
+        """
+        no_of_rounds = len(
+            glob.glob(
+                os.path.join(glob.escape(weights_dir), "round_*.npz")
+            )
+        )
+        self.files = [
+            os.path.join(weights_dir, "round_{}.npz".format(i))
+            for i in range(no_of_rounds)
+        ]
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, index):
+        """
+        Load the weights of one round.
+
+        Parameters
+        ----------
+        index : int
+            Number of the round.
+
+        Returns
+        -------
+        list
+            List of arrays, as returned by model.get_weights().
+
+        """
+        with np.load(self.files[index]) as data:
+            return [
+                data["arr_{}".format(i)] for i in range(len(data.files))
+            ]
+
+
+class ChainedWeights(Sequence):
+    """Weights of the rounds of several scans, in one sequence."""
+
+    def __init__(self, weights):
+        """
+        Chain the weights of several scans.
+
+        Parameters
+        ----------
+        weights : list
+            One sequence of round weights per scan.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.weights = weights
+        self.ends = np.cumsum([len(w) for w in weights]).tolist()
+
+    def __len__(self):
+        return self.ends[-1] if self.ends else 0
+
+    def __getitem__(self, index):
+        """
+        Return the weights of one round across all scans.
+
+        Parameters
+        ----------
+        index : int
+            ID of the round.
+
+        Returns
+        -------
+        list
+            List of arrays, as returned by model.get_weights().
+
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Round ID out of range.")
+
+        scan_no = bisect.bisect_right(self.ends, index)
+        start = self.ends[scan_no - 1] if scan_no > 0 else 0
+
+        return self.weights[scan_no][index - start]
+
+
 class Analysis:
     """Class for the analysis of results from one or multiple scans."""
 
@@ -636,7 +875,14 @@ class Analysis:
             Dictionary of all parameters used in the rounds..
 
         """
-        params = dict(self.df.iloc[model_id])
+        # Convert all rows to dicts once instead of building a Series
+        # for every lookup.
+        try:
+            records = self._records
+        except AttributeError:
+            records = self._records = self.df.to_dict("records")
+
+        params = dict(records[model_id])
 
         return params
 
@@ -660,33 +906,25 @@ class Analysis:
             ID of the best round.
 
         """
-        return self.df[self.df[metric] == self.df[metric].min()].index[
-            0
-        ]
+        if low:
+            return self.df[metric].idxmin()
+        return self.df[metric].idxmax()
 
     def _minimum_value(self, metric):
         """Return the minimum value for a given metric."""
-        return min(self.df[metric])
+        return self.df[metric].min()
 
     def _exclude_unchanged(self):
         """Exlude the parameters not changed during the scans."""
-        exclude = []
-        for key, values in self.df.iteritems():
-            if values.nunique() == 1:
-                exclude.append(key)
+        no_of_unique = self.df.nunique()
+        exclude = no_of_unique.index[no_of_unique == 1].tolist()
 
         return exclude
 
     def _cols(self, metric, exclude):
         """Remove other than desired metric from data table."""
-        cols = [
-            col
-            for col in self.df.columns
-            if col not in exclude + [metric]
-        ]
-
-        # make sure only unique values in col list
-        cols = list(set(cols))
+        # Index.difference also makes sure the columns are unique.
+        cols = self.df.columns.difference(exclude + [metric]).tolist()
 
         return cols
 
@@ -723,11 +961,20 @@ class Analysis:
 
         """
         exclude = self._exclude_unchanged()
-        out = self.df[self._cols(metric, exclude)]
-
-        out.insert(0, metric, self.df[metric])
-
-        corr_data = out.corr(method="pearson")
+        out = self.df[[metric] + self._cols(metric, exclude)]
+        # Like DataFrame.corr, only use the numeric columns.
+        out = out.select_dtypes(include=["number", "bool"])
+
+        values = out.to_numpy(dtype=float)
+        if np.isnan(values).any():
+            # Pairwise handling of missing values.
+            return out.corr(method="pearson")
+
+        corr_data = pd.DataFrame(
+            np.corrcoef(values, rowvar=False),
+            index=out.columns,
+            columns=out.columns,
+        )
 
         return corr_data
 
@@ -878,16 +1125,26 @@ class LinePlot(Plot):
         self.data = data
         self.name = "line plot_" + self.metric
 
-    def plot(self):
+    def plot(self, max_markers=500):
         """
         Create a line plot of the data.
-        
+
+        Parameters
+        ----------
+        max_markers : int, optional
+            Maximum number of rounds marked on the line. For longer
+            scans, only every n-th round is marked so that the number
+            of drawn markers stays bounded.
+            The default is 500.
+
         Returns
         -------
         None.
 
         """
         self.x = range(self.data.shape[0])
+        no_of_rounds = self.data.shape[0]
+        markevery = max(1, int(np.ceil(no_of_rounds / max_markers)))
 
         self.fig, self.ax = plt.subplots(figsize=(10, 8))
 
@@ -898,6 +1155,7 @@ class LinePlot(Plot):
             linestyle="solid",
             linewidth=2,
             marker="o",
+            markevery=markevery,
             markersize=7,
             markeredgewidth=1,
             mfc="blue",
@@ -1028,10 +1286,7 @@ class CorrPlot(Plot):
         p.set_xticklabels(self.data, rotation=90)
         p.set_yticklabels(self.data, rotation=0)
 
-        for tick in self.ax.xaxis.get_major_ticks():
-            tick.label.set_fontsize(13)
-        for tick in self.ax.yaxis.get_major_ticks():
-            tick.label.set_fontsize(13)
+        self.ax.tick_params(axis="both", labelsize=13)
 
 
 class KDEPlot(Plot):
@@ -1098,12 +1353,9 @@ class KDEPlot(Plot):
             self.font_dict,
         )
 
-        for tick in self.ax.xaxis.get_major_ticks():
-            tick.label.set_fontsize(13)
-            tick.label.set_color("black")
-        for tick in self.ax.yaxis.get_major_ticks():
-            tick.label.set_fontsize(13)
-            tick.label.set_color("black")
+        self.ax.tick_params(
+            axis="both", labelsize=13, labelcolor="black"
+        )
 
 
 class BarPlot(Plot):
@@ -8,8 +8,11 @@ import os
 import pickle
 import numpy as np
 import json
+import matplotlib
 from matplotlib import pyplot as plt
 import matplotlib.colors as mcolors
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import seaborn as sns
 
 from docx import Document
@@ -18,6 +21,35 @@ from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.shared import Cm, Pt
 
 #%%
+def create_figure(**kwargs):
+    """
+    Create a new matplotlib figure.
+
+    Without a GUI (e.g., headless training runs), the figure is drawn
+    directly on an Agg canvas. This skips the pyplot figure manager,
+    so the figure is freed as soon as it is no longer referenced.
+    Otherwise, pyplot is used so that the figure is shown as usual.
+
+    Parameters
+    ----------
+    **kwargs
+        Keyword arguments passed to the Figure.
+
+    Returns
+    -------
+    fig : matplotlib.figure.Figure
+        The new figure.
+
+    """
+    if matplotlib.get_backend().lower() == "agg":
+        fig = Figure(**kwargs)
+        FigureCanvasAgg(fig)
+    else:
+        fig = plt.figure(**kwargs)
+
+    return fig
+
+
 class SpectraPlot:
     """A nx5 array of plots from a given data set."""
 
@@ -46,10 +78,29 @@ class SpectraPlot:
         if (self.no_of_spectra % self.no_of_cols) != 0:
             self.no_of_rows += 1
 
-        self.fig, self.axs = plt.subplots(
-            nrows=self.no_of_rows, ncols=self.no_of_cols
+        # The subplot positions are set manually below, so tight_layout
+        # must not recompute them on every draw, even if
+        # figure.autolayout is set in the rcParams.
+        with matplotlib.rc_context({"figure.autolayout": False}):
+            self.fig = create_figure()
+
+        # Energy limits of all spectra, calculated in one go.
+        self.x_max = np.max(self.data[:, :, 0], axis=1)
+        self.x_min = np.min(self.data[:, :, 0], axis=1)
+        # Spectra on the same energy grid share one x axis, so that
+        # the limits and ticks are only handled once.
+        self.share_x = bool(
+            np.all(self.x_max == self.x_max[0])
+            and np.all(self.x_min == self.x_min[0])
+        )
+
+        self.axs = self.fig.subplots(
+            nrows=self.no_of_rows,
+            ncols=self.no_of_cols,
+            sharex=self.share_x,
+            squeeze=False,
         )
-        plt.subplots_adjust(
+        self.fig.subplots_adjust(
             left=0.125,
             bottom=0.5,
             right=4.8,
@@ -67,43 +118,36 @@ class SpectraPlot:
         fig, axs
             Matplotlib objects.
         """
-        for i in range(self.no_of_spectra):
-            row, col = int(i / self.no_of_cols), i % self.no_of_cols
-            x = self.data[i][:, 0]
-            y = self.data[i][:, 1]
-            annot = self.annots[i]
-
-            try:
-                self.axs[row, col].plot(x, y)
-                self.axs[row, col].invert_xaxis()
-                self.axs[row, col].set_xlim(np.max(x), np.min(x))
-                self.axs[row, col].set_xlabel("Binding energy (eV)")
-                self.axs[row, col].set_ylabel("Intensity (arb. units)")
-                self.axs[row, col].text(
-                    0.025,
-                    0.4,
-                    annot,
-                    horizontalalignment="left",
-                    verticalalignment="top",
-                    transform=self.axs[row, col].transAxes,
-                    fontsize=12,
-                )
-
-            except IndexError:
-                self.axs[row].plot(x, y)
-                self.axs[row].invert_xaxis()
-                self.axs[row].set_xlim(np.max(x), np.min(x))
-                self.axs[row].set_xlabel("Binding energy (eV)")
-                self.axs[row].set_ylabel("Intensity (arb. units)")
-                self.axs[row].text(
-                    0.025,
-                    0.4,
-                    annot,
-                    horizontalalignment="left",
-                    verticalalignment="top",
-                    transform=self.axs[row, col].transAxes,
-                    fontsize=12,
-                )
+        if self.share_x:
+            self.axs[0, 0].set_xlim(self.x_max[0], self.x_min[0])
+            # The spectra above the empty cells of an incomplete last
+            # row still need their tick labels.
+            last_row_filled = self.no_of_spectra % self.no_of_cols
+            if self.no_of_rows > 1 and last_row_filled:
+                for ax in self.axs[-2, last_row_filled:]:
+                    ax.xaxis.set_tick_params(labelbottom=True)
+
+        for ax, spectrum, annot, x_max, x_min in zip(
+            self.axs.flat,
+            self.data,
+            self.annots,
+            self.x_max,
+            self.x_min,
+        ):
+            ax.plot(spectrum[:, 0], spectrum[:, 1])
+            if not self.share_x:
+                ax.set_xlim(x_max, x_min)
+            ax.set_xlabel("Binding energy (eV)")
+            ax.set_ylabel("Intensity (arb. units)")
+            ax.text(
+                0.025,
+                0.4,
+                annot,
+                horizontalalignment="left",
+                verticalalignment="top",
+                transform=ax.transAxes,
+                fontsize=12,
+            )
 
         return self.fig, self.axs
 
@@ -158,12 +202,16 @@ class ClassDistribution:
             self.cd["validation data"][str(i)] = 0
             self.cd["test data"][str(i)] = 0
 
+        num_classes = data_list[0].shape[1]
+
         if self.task == "classification":
             for i, dataset in enumerate(data_list):
                 key = list(self.cd.keys())[i]
-                for j, datapoint in enumerate(dataset):
-                    argmax_class = np.argmax(datapoint, axis=0)
-                    self.cd[key][str(argmax_class)] += 1
+                counts = np.bincount(
+                    np.argmax(dataset, axis=1), minlength=num_classes
+                )
+                for j, count in enumerate(counts):
+                    self.cd[key][str(j)] = int(count)
 
         elif self.task == "regression":
             for i, dataset in enumerate(data_list):
@@ -174,10 +222,9 @@ class ClassDistribution:
         elif self.task == "multi_class_detection":
             for i, dataset in enumerate(data_list):
                 key = list(self.cd.keys())[i]
-                for j, datapoint in enumerate(dataset):
-                    non_zero_classes_args = np.where(datapoint > 0.0)[0]
-                    for n in non_zero_classes_args:
-                        self.cd[key][str(n)] += 1
+                counts = np.count_nonzero(dataset > 0.0, axis=0)
+                for j, count in enumerate(counts):
+                    self.cd[key][str(j)] = int(count)
 
     def plot(self, labels):
         """
@@ -261,7 +308,8 @@ class TrainingGraphs:
 
         try:
             metric_history = self.history[metric]
-            fig, ax = plt.subplots()
+            fig = create_figure()
+            ax = fig.subplots()
             ax.plot(metric_history, linewidth=3)
             try:
                 val_key = "val_" + metric
@@ -430,6 +478,9 @@ class WeightDistributions:
         return fig
 
 
+_CAPTION_SPACING = Pt(12)
+
+
 class Report:
     """Report on the results of the training in keras."""
 
@@ -457,16 +508,10 @@ class Report:
         font.size = Pt(10)
 
         # Get the data
-        root_dir = os.getcwd()
-        self.model_dir = os.path.join(
-            *[root_dir, "runs", dir_name, "model",]
-        )
-        self.log_dir = os.path.join(
-            *[root_dir, "runs", dir_name, "logs"]
-        )
-        self.fig_dir = os.path.join(
-            *[root_dir, "runs", dir_name, "figures"]
-        )
+        self.root_dir = os.path.join(*[os.getcwd(), "runs", dir_name])
+        self.model_dir = os.path.join(self.root_dir, "model")
+        self.log_dir = os.path.join(self.root_dir, "logs")
+        self.fig_dir = os.path.join(self.root_dir, "figures")
 
         (
             self.name_data,
@@ -495,10 +540,10 @@ class Report:
         name_table = self.document.add_table(
             rows=len(self.name_data.keys()), cols=2
         )
-        for key, value in self.name_data.items():
-            j = int(list(self.name_data.keys()).index(key))
-            name_table.cell(j, 0).text = key + ":"
-            name_table.cell(j, 1).text = str(value)
+        name_cells = name_table._cells
+        for j, (key, value) in enumerate(self.name_data.items()):
+            name_cells[2 * j].text = key + ":"
+            name_cells[2 * j + 1].text = str(value)
 
         self.document.add_heading("Distribution:", 1)
         dist_table = self.document.add_table(
@@ -507,15 +552,19 @@ class Report:
         )
 
         dist_table.alignment = WD_TABLE_ALIGNMENT.CENTER
+        dist_cells = dist_table._cells
+        ncols = len(dist_table.columns)
         for i, name in enumerate(self.name_data["Labels"]):
-            dist_table.cell(0, i + 1).text = name
-        for item, param in self.class_dist.items():
-            j = int(list(self.class_dist.keys()).index(item)) + 1
-            dist_table.cell(j, 0).text = item
-
-            for key, value in enumerate(self.class_dist[item]):
-                k = int(key) + 1
-                dist_table.cell(j, k).text = str(np.round(value, 3))
+            dist_cells[i + 1].text = name
+        for j, (item, param) in enumerate(
+            self.class_dist.items(), start=1
+        ):
+            dist_cells[j * ncols].text = item
+
+            for k, value in enumerate(param, start=1):
+                dist_cells[j * ncols + k].text = str(
+                    np.round(value, 3)
+                )
 
         self.document.add_page_break()
 
@@ -526,10 +575,10 @@ class Report:
             rows=len(self.train_data.keys()), cols=2
         )
 
-        for key, value in self.train_data.items():
-            j = int(list(self.train_data.keys()).index(key))
-            train_table.cell(j, 0).text = key + ":"
-            train_table.cell(j, 1).text = str(value)
+        train_cells = train_table._cells
+        for j, (key, value) in enumerate(self.train_data.items()):
+            train_cells[2 * j].text = key + ":"
+            train_cells[2 * j + 1].text = str(value)
 
         # Add the model architecture
         self.document.add_heading("Model architecture", 1)
@@ -558,21 +607,19 @@ class Report:
         self.document.add_heading("Results", 1)
 
         result_table = self.document.add_table(rows=2, cols=2)
-        result_table.cell(0, 0).text = "Test loss:"
-        result_table.cell(0, 1).text = str(
+        result_cells = result_table._cells
+        result_cells[0].text = "Test loss:"
+        result_cells[1].text = str(
             np.round(self.results["test_loss"], decimals=3)
         )
         try:
-            result_table.cell(1, 0).text = "Test accuracy:"
-            result_table.cell(1, 1).text = str(
+            result_cells[2].text = "Test accuracy:"
+            result_cells[3].text = str(
                 np.round(self.results["test_accuracy"], decimals=3)
             )
 
-            for row in result_table.rows:
-                for cell in row.cells:
-                    cell.paragraphs[
-                        0
-                    ].alignment = WD_ALIGN_PARAGRAPH.CENTER
+            for cell in result_cells:
+                cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
         except KeyError:
             pass
 
@@ -583,50 +630,47 @@ class Report:
             "Predictions for 5 random examples", 1
         )
 
-        self.document.add_heading("Training data", 2)
-
-        r = np.random.randint(0, self.results["y_train"].shape[0] - 5)
-        pred_train_5 = self.results["pred_train"][r : r + 5, :]
-        y_train_5 = self.results["y_train"][r : r + 5, :]
+        labels = self.name_data["Labels"]
+        sections = (("Training data", "train"), ("Test data", "test"))
+        for title, kind in sections:
+            self.document.add_heading(title, 2)
+
+            y = self.results[f"y_{kind}"]
+            pred = self.results[f"pred_{kind}"]
+            r = np.random.randint(0, y.shape[0] - 5)
+            blocks = (
+                ("Predictions:", pred[r : r + 5], True),
+                ("Correct labels:", y[r : r + 5], False),
+            )
 
-        p = self.document.add_paragraph()
-        p.paragraph_format.space_before = Pt(12)
-        p.paragraph_format.space_after = None
-        run = p.add_run()
-        run.text = "Predictions:"
-        run.font.underline = True
-        _ = self.add_result_table(pred_train_5)
+            for caption, data_array, normalize in blocks:
+                self._add_caption(caption)
+                self._fill_result_table(
+                    self._format_result_array(data_array, normalize),
+                    labels,
+                )
 
-        p = self.document.add_paragraph()
-        p.paragraph_format.space_before = Pt(12)
-        p.paragraph_format.space_after = None
-        run = p.add_run()
-        run.text = "Correct labels:"
-        run.font.underline = True
-        self.add_result_table(y_train_5)
+    def _add_caption(self, text):
+        """
+        Add an underlined caption paragraph above a table.
 
-        self.document.add_heading("Test data", 2)
-        s = np.random.randint(0, self.results["y_test"].shape[0] - 5)
-        pred_test_5 = self.results["pred_test"][s : s + 5, :]
-        y_test_5 = self.results["y_test"][s : s + 5, :]
+        Parameters
+        ----------
+        text : str
+            Text of the caption.
 
-        p = self.document.add_paragraph()
-        p.paragraph_format.space_before = Pt(12)
-        p.paragraph_format.space_after = None
-        run = p.add_run()
-        run.text = "Predictions:"
-        run.font.underline = True
-        self.add_result_table(pred_test_5)
+        Returns
+        -------
+        None.
 
+        """
         p = self.document.add_paragraph()
-        p.paragraph_format.space_before = Pt(12)
+        p.paragraph_format.space_before = _CAPTION_SPACING
         p.paragraph_format.space_after = None
-        run = p.add_run()
-        run.text = "Correct labels:"
+        run = p.add_run(text)
         run.font.underline = True
-        self.add_result_table(y_test_5)
 
-    def add_result_table(self, data_array):
+    def add_result_table(self, data_array, normalize=True):
         """
         Store and display the results from training.
 
@@ -634,37 +678,80 @@ class Report:
         ----------
         data_array : ndarray
             Array with the results from training.
+        normalize : bool, optional
+            If True, the rows are treated as predictions and are
+            normalized before display. Use False for labels.
+            The default is True.
 
         Returns
         -------
         None.
 
         """
-        new_table = self.document.add_table(
-            rows=data_array.shape[0] + 1, cols=data_array.shape[1]
+        self._fill_result_table(
+            self._format_result_array(data_array, normalize),
+            self.name_data["Labels"],
         )
-        for row in new_table.rows:
-            row.height = Cm(0.5)
-            row.height_rule = WD_ROW_HEIGHT_RULE.EXACTLY
 
-        for i, name in enumerate(self.name_data["Labels"]):
-            new_table.cell(0, i).text = name
-            new_table.cell(0, i).paragraphs[
-                0
-            ].alignment = WD_ALIGN_PARAGRAPH.CENTER
+    def _format_result_array(self, data_array, normalize):
+        """
+        Convert an array of results to the strings shown in a table.
 
-        if data_array.dtype == "float32":
+        Parameters
+        ----------
+        data_array : ndarray
+            Array with the results from training.
+        normalize : bool
+            If True, each row is normalized to a sum of 1 and rounded
+            to two decimals before the conversion (predictions).
+            Labels are shown as they are.
+
+        Returns
+        -------
+        ndarray
+            Array of str with the same shape as data_array.
+
+        """
+        if normalize:
             a = np.around(data_array, decimals=4)
             row_sums = a.sum(axis=1)
             data_array = a / row_sums[:, np.newaxis]
             data_array = np.around(data_array, decimals=2)
 
-        for i in range(data_array.shape[0]):
-            for j in range(data_array.shape[1]):
-                new_table.cell(i + 1, j).text = str(data_array[i, j])
-                new_table.cell(i + 1, j).paragraphs[
-                    0
-                ].alignment = WD_ALIGN_PARAGRAPH.CENTER
+        return data_array.astype(str)
+
+    def _fill_result_table(self, strs, labels):
+        """
+        Add a table with a header of labels and the given strings.
+
+        Parameters
+        ----------
+        strs : ndarray
+            2D array of str, one row per example.
+        labels : list
+            Names of the classes, used as the table header.
+
+        Returns
+        -------
+        None.
+
+        """
+        new_table = self.document.add_table(
+            rows=strs.shape[0] + 1, cols=strs.shape[1]
+        )
+        for row in new_table.rows:
+            row.height = Cm(0.5)
+            row.height_rule = WD_ROW_HEIGHT_RULE.EXACTLY
+
+        cells = new_table._cells
+        ncols = strs.shape[1]
+        for i, name in enumerate(labels):
+            cells[i].text = name
+            cells[i].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+        for cell, text in zip(cells[ncols:], strs.ravel()):
+            cell.text = text
+            cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
 
     def get_hyperparams(self):
         """
@@ -723,6 +810,7 @@ class Report:
         Load the results from the pickle file.
         
         Results include e.g. the test data and the predictions.
+        Only the entries used in the report are kept.
 
         Returns
         -------
@@ -735,7 +823,17 @@ class Report:
         with open(file_name, "rb") as pickle_file:
             data = pickle.load(pickle_file)
 
-        return data
+        keys = (
+            "y_train",
+            "y_test",
+            "pred_train",
+            "pred_test",
+            "test_loss",
+            "test_accuracy",
+            "class_distribution",
+        )
+
+        return {key: data[key] for key in keys if key in data}
 
     def write(self):
         """
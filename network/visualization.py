@@ -69,11 +69,12 @@ class AttentiveResponseMap:
 
         for yi in y:
             ax.plot(self.energies, yi)
-            ax.set_xlim(
-                left=np.max(self.energies), right=np.min(self.energies)
-            )
-            ax.set_xlabel("Binding energy (eV)")
-            ax.set_ylabel("Intensity (arb. units)")
+
+        ax.set_xlim(
+            left=np.max(self.energies), right=np.min(self.energies)
+        )
+        ax.set_xlabel("Binding energy (eV)")
+        ax.set_ylabel("Intensity (arb. units)")
 
         return ax
 
@@ -39,23 +39,21 @@ class TextParser:
         return self._build_dict()
 
     def _read_lines(self, filepath):
-        self.data = []
         self.filepath = filepath
         with open(filepath) as fp:
-            for line in fp:
-                self.data += [line]
+            self.header = fp.readline()
+            self.data = fp.read()
 
     def _parse_header(self):
         """
-        Separate the dataset into header and data.
+        Strip the line break from the header line.
 
         Returns
         -------
         None.
 
         """
-        self.header = str(self.data[0]).split("\n")[0]
-        self.data = self.data[1:]
+        self.header = self.header.split("\n")[0]
 
     def _build_dict(self):
         """
@@ -67,9 +65,10 @@ class TextParser:
             Data dictionary.
 
         """
-        lines = np.array(
-            [[float(i) for i in d.split()] for d in self.data]
-        )
+        # Split the data block at once and let NumPy convert the tokens.
+        no_of_columns = len(self.data.split("\n", 1)[0].split())
+        tokens = self.data.split()
+        lines = np.array(tokens, dtype=float).reshape(-1, no_of_columns)
         x = lines[:, 0]
         y = lines[:, 1]
         x, y = self._check_step_width(x, y)
@@ -106,8 +105,9 @@ class TextParser:
         """
         start = x[0]
         stop = x[-1]
-        x1 = np.roll(x, -1)
-        diff = np.abs(np.subtract(x, x1))
+        if stop <= start:
+            return x, y
+        diff = np.abs(np.diff(x))
         step = round(np.min(diff[diff != 0]), 2)
         if (stop - start) / step > len(x):
             x, y = self._interpolate(x, y, step)
@@ -137,21 +137,24 @@ class TextParser:
             Interpolated intensity array.
 
         """
-        new_x = []
-        new_y = []
-        for i in range(len(x) - 1):
-            diff = np.abs(np.around(x[i + 1] - x[i], 2))
-            if (diff > step) & (diff < 10):
-                for j in range(int(np.round(diff / step))):
-                    new_x += [x[i] + j * step]
-                    k = j / int(diff / step)
-                    new_y += [y[i] * (1 - k) + y[i + 1] * k]
-            else:
-                new_x += [x[i]]
-                new_y += [y[i]]
-
-        new_x += [x[-1]]
-        new_y += [y[-1]]
-        x = new_x
-        y = np.array(new_y)
+        diff = np.abs(np.around(np.diff(x), 2))
+        fill = (diff > step) & (diff < 10)
+
+        # Number of points that each interval contributes to the new
+        # arrays (intervals that are not filled only keep their start).
+        no_of_points = np.ones(len(diff), dtype=int)
+        no_of_points[fill] = np.round(diff[fill] / step).astype(int)
+        divisor = np.ones(len(diff))
+        divisor[fill] = (diff[fill] / step).astype(int)
+
+        interval = np.repeat(np.arange(len(diff)), no_of_points)
+        starts = np.cumsum(no_of_points) - no_of_points
+        j = np.arange(len(interval)) - np.repeat(starts, no_of_points)
+        k = j / divisor[interval]
+
+        new_x = x[interval] + j * step
+        new_y = y[interval] * (1 - k) + y[interval + 1] * k
+
+        x = np.append(new_x, x[-1])
+        y = np.append(new_y, y[-1])
         return x, y
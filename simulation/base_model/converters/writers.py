@@ -9,10 +9,11 @@ import json
 # import xlsxwriter
 import re
 import numpy as np
-from copy import copy
 
 from .vamas import VamasHeader, Block
 
+_DIGIT_SPLIT = re.compile(r"(\d)")
+
 #%%
 class TextWriter:
     def __init__(self):
@@ -23,18 +24,22 @@ class TextWriter:
 
         with open(str(filename), "w") as file:
             for line in lines:
-                file.writelines(line["header_line"] + "\n")
-                for data_line in line["data_lines"]:
-                    file.writelines(str(data_line) + "\n")
+                file.write(
+                    line["header_line"]
+                    + "\n"
+                    + "\n".join(line["data_lines"])
+                    + "\n"
+                )
 
     def build_lines(self, data):
         lines = []
         for d in data:
             header_line = d["spectrum_type"] + " " + d["group_name"]
-            data_lines = [
-                str(np.round(x, 3)) + " " + str(y)
-                for x, y in zip(d["data"]["x"], d["data"]["y0"])
-            ]
+            x = np.round(np.asarray(d["data"]["x"], dtype=float), 3)
+            y = np.asarray(d["data"]["y0"])
+            data_lines = np.char.add(
+                np.char.add(x.astype(str), " "), y.astype(str)
+            ).tolist()
             lines.append(
                 {"header_line": header_line, "data_lines": data_lines}
             )
@@ -45,6 +50,9 @@ class TextWriter:
 class VamasWriter:
     def __init__(self):
         self.normalize = 0
+        # Significant digits of the written intensities; None keeps
+        # the full precision.
+        self.precision = None
 
     def write(self, data, filename):
         """ This method converts a nested dictionary into vamas format
@@ -63,7 +71,6 @@ class VamasWriter:
         self.loops_averaged = 0
         self.count_type = "Counts per Second"
         self.blocks_counter = 0
-        self.blocks = []
         for spec in data:
             block = Block()
             block.sampleID = spec["group_name"]
@@ -83,11 +90,9 @@ class VamasWriter:
                 + "none"
             )
             block.expVarValue = 0
-            split_string = re.split(r"(\d)", spec["spectrum_type"])
+            split_string = _DIGIT_SPLIT.split(spec["spectrum_type"])
             species = split_string[0]
-            transition = ""
-            for i in split_string[1:]:
-                transition += i
+            transition = "".join(split_string[1:])
             block.speciesLabel = species
             block.transitionLabel = transition
             block.noScans = spec["scans"]
@@ -113,21 +118,20 @@ class VamasWriter:
             block.workFunction = setting["workfunction"]
             block.dwellTime = setting["dwell_time"]
 
+            y0 = np.asarray(spec["data"]["y0"])
             y_units = setting["y_units"]
             if y_units == "Counts per Second":
-                y = [
-                    i * float(block.dwellTime) * float(block.noScans)
-                    for i in spec["data"]["y0"]
-                ]
+                # Scale in double precision, as for scalar values.
+                y = (
+                    y0.astype(float)
+                    * float(block.dwellTime)
+                    * float(block.noScans)
+                )
             else:
-                y = [i for i in spec["data"]["y0"]]
+                y = y0
             if self.normalize != 0:
                 norm = self.normalize
-                y = [
-                    spec["data"]["y0"][i]
-                    / spec["data"]["y" + str(norm)][i]
-                    for i in range(len(spec["data"]["y0"]))
-                ]
+                y = y0 / np.asarray(spec["data"]["y" + str(norm)])
             x_units = setting["x_units"]
             if (x_units == "Binding Energy") & (
                 setting["scan_mode"] != "FixedEnergies"
@@ -142,7 +146,7 @@ class VamasWriter:
                 spec["data"]["x"][1] - spec["data"]["x"][0]
             )
 
-            if "nr_values" not in setting.keys():
+            if "nr_values" not in setting:
                 nr_values = len(spec["data"]["y0"])
                 block.numOrdValues = str(
                     int(nr_values * int(block.noAdditionalParams))
@@ -152,25 +156,28 @@ class VamasWriter:
                     int(setting["nr_values"])
                     * int(block.noAdditionalParams)
                 )
-            block.minOrdValue1 = min(spec["data"]["y0"])
-            block.maxOrdValue1 = max(spec["data"]["y0"])
+            block.minOrdValue1 = y0.min()
+            block.maxOrdValue1 = y0.max()
             block.minOrdValue2 = 1
             block.maxOrdValue2 = 1
-            for i in y:
-                block.dataString += str(i) + "\n1\n"
-            block.dataString = block.dataString[:-1]
-            self.blocks += [copy(block)]
-            block.dataString = ""
+            if self.precision is None:
+                # Format the array elements themselves, so that e.g.
+                # float32 values keep their short representation.
+                values = y.astype(str).tolist()
+            else:
+                values = np.char.mod(f"%.{self.precision}g", y).tolist()
+            block.dataString = "\n".join(i + "\n1" for i in values)
+            self.blocks.append(block)
         self.num_spectra = len(self.blocks)
         self.vamas_header.noBlocks = self.num_spectra
 
+        # Collect all lines and write them in one go.
+        lines = [
+            str(value) for value in self.vamas_header.__dict__.values()
+        ]
+        for block in self.blocks:
+            lines += [str(value) for value in block.__dict__.values()]
+        lines.append("end of experiment")
+
         with open(str(filename), "w") as file:
-            for item in self.vamas_header.__dict__:
-                file.writelines(
-                    str(self.vamas_header.__dict__[item]) + "\n"
-                )
-            for block in self.blocks:
-                for item in block.__dict__:
-                    file.writelines(str(block.__dict__[item]) + "\n")
-            file.writelines("end of experiment")
-            file.close()
+            file.write("\n".join(lines))
@@ -9,7 +9,8 @@ Basic definition of classes and peak shapes for simulating spectra.
 
 import numpy as np
 import os
-from scipy.signal import fftconvolve
+from functools import lru_cache
+from scipy.fft import rfft, irfft, next_fast_len
 from scipy.interpolate import interp1d
 
 
@@ -75,6 +76,60 @@ def _resample_array(y, x0, x1):
     return fn(x1)
 
 
+@lru_cache(maxsize=1024)
+def _gaussian_kernel_rfft(sigma, len_x, step, len_y):
+    """
+    Calculate the real FFT of a Gaussian broadening kernel.
+
+    The FWHM values used in a simulation run are drawn from a limited
+    set of integers, so the same kernels are needed many times.
+    Therefore, the results are cached.
+
+    Parameters
+    ----------
+    sigma : float
+        Standard deviation of the Gaussian.
+    len_x : int
+        Number of points of the kernel.
+    step : float
+        Step size between points.
+    len_y : int
+        Length of the (padded) lineshape the kernel is convolved
+        with.
+
+    Returns
+    -------
+    kernel_rfft : ndarray
+        Read-only real FFT of the kernel.
+    n_fft : int
+        FFT length used for the convolution.
+    len_kernel : int
+        Number of points of the kernel.
+
+    """
+    # To preserve the position of spectral lines, the
+    # broadening function must be centered at
+    # N//2 - (1-N%2) = N//2 + N%2 - 1.
+    gauss_x = (
+        np.arange(len_x, dtype=int) - sum(divmod(len_x, 2)) + 1
+    ) * step
+
+    # The broadening spectrum is a synthetic spectrum.
+    broadening_spectrum = SyntheticSpectrum(
+        gauss_x[0], gauss_x[-1], step, label="Gauss"
+    )
+    broadening_spectrum.add_component(
+        Gauss(position=0, width=sigma, intensity=1)
+    )
+    kernel = broadening_spectrum.lineshape
+
+    n_fft = next_fast_len(len_y + len(kernel) - 1)
+    kernel_rfft = rfft(kernel, n_fft)
+    kernel_rfft.setflags(write=False)
+
+    return kernel_rfft, n_fft, len(kernel)
+
+
 class Spectrum:
     """Basic class for a spectrum."""
 
@@ -465,7 +520,9 @@ class SyntheticSpectrum(Spectrum):
         """
         self.clear_lineshape()
         for component in self.components:
-            y = np.array([component.function(x) for x in self.x])
+            # The peak functions are written with NumPy ufuncs, so
+            # they can be evaluated on the whole x array at once.
+            y = component.function(self.x)
             self.lineshape = np.add(self.lineshape, y)
 
     def add_component(self, component, rebuild=True):
@@ -579,25 +636,16 @@ class SimulatedSpectrum(Spectrum):
             # scale the shift by the step size
             shift = int(np.round(shift_x / self.step, 1))
 
-            begin_value = self.lineshape[0]
-            end_value = self.lineshape[-1]
-
-            # Edge handling by concatenating the first/last value
+            # The shift is a single gather. Edge handling by clipping
+            # the indices, i.e., the first/last value is repeated
             # so that the lineshape shape is conserved.
-            if shift_x < 0:
-                self.lineshape = np.concatenate(
-                    (
-                        np.full(-shift, begin_value),
-                        self.lineshape[:shift],
-                    )
-                )
-
-            elif shift_x > 0:
-                self.lineshape = np.concatenate(
-                    (self.lineshape[shift:], np.full(shift, end_value))
+            if shift != 0:
+                indices = np.clip(
+                    np.arange(len(self.lineshape)) + shift,
+                    0,
+                    len(self.lineshape) - 1,
                 )
-            else:
-                pass
+                self.lineshape = self.lineshape[indices]
 
             self.shift_x = shift_x
 
@@ -624,12 +672,12 @@ class SimulatedSpectrum(Spectrum):
             noise = intensity_diff / signal_to_noise * 10
 
             # A poisson distributed noise is multplied by the noise
-            # factor and added to the lineshape.
+            # factor and added to the lineshape. The scalar factors
+            # are combined first so that the noise array is only
+            # scaled once.
             lamb = 1000
-            poisson_noise = (
-                noise
-                * np.random.poisson(lamb, self.lineshape.shape)
-                / lamb
+            poisson_noise = (noise / lamb) * np.random.poisson(
+                lamb, self.lineshape.shape
             )
 
             self.lineshape = self.lineshape + poisson_noise
@@ -660,25 +708,6 @@ class SimulatedSpectrum(Spectrum):
             fwhm = np.mean(self.x) / float(resolution)
             sigma = fwhm / (2.0 * np.sqrt(2.0 * np.log(2.0)))
 
-            # To preserve the position of spectral lines, the
-            # broadening function must be centered at
-            # N//2 - (1-N%2) = N//2 + N%2 - 1.
-            len_x = len(self.x)
-            step = self.step
-            gauss_x = (
-                np.arange(len_x, dtype=np.int)
-                - sum(divmod(len_x, 2))
-                + 1
-            ) * step
-
-            # The broadening spectrum is a synthetic spectrum.
-            broadening_spectrum = SyntheticSpectrum(
-                gauss_x[0], gauss_x[-1], step, label="Gauss"
-            )
-            broadening_spectrum.add_component(
-                Gauss(position=0, width=sigma, intensity=1)
-            )
-
             # This assures that the edges are handled correctly.
             len_y = len(self.lineshape)
             y = np.concatenate(
@@ -691,11 +720,16 @@ class SimulatedSpectrum(Spectrum):
 
             # This performs the convolution of the initial lineshape
             # with the Gaussian kernel.
-            # Note: The convolution is performed in the Fourier space.
-            result = fftconvolve(
-                y, broadening_spectrum.lineshape, mode="same"
+            # Note: The convolution is performed in the Fourier space
+            # using real FFTs of a fast length. Only the central part
+            # of the full convolution (i.e., the unpadded lineshape)
+            # is kept.
+            kernel_rfft, n_fft, len_kernel = _gaussian_kernel_rfft(
+                sigma, len(self.x), self.step, len(y)
             )
-            result = result[len_y:-len_y]
+            result = irfft(rfft(y, n_fft) * kernel_rfft, n_fft)
+            start = (len_kernel - 1) // 2 + len_y
+            result = result[start : start + len_y]
 
             self.lineshape = result
         self.fwhm = fwhm
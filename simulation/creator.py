@@ -12,16 +12,23 @@ import json
 import datetime
 import h5py
 from time import time
-import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
 
 
 from base_model.spectra import (
     safe_arange_with_edges,
     MeasuredSpectrum,
 )
-from base_model.figures import Figure
 from sim import Simulation
 
+REFERENCE_DATAPATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)).partition(
+        "simulation"
+    )[0],
+    "data",
+    "references",
+)
+
 # %%
 class Creator:
     """Class for simulating mixed XPS spectra."""
@@ -70,6 +77,9 @@ class Creator:
 
             self.sim_ranges = self.params["sim_ranges"]
 
+        # Random number generator used for all random choices.
+        self.rng = np.random.default_rng()
+
         timestamp = datetime.datetime.now().strftime("%Y%m%d")
         self.params["timestamp"] = timestamp
 
@@ -111,6 +121,16 @@ class Creator:
         self.input_spectra = self.load_input_spectra(
             self.params["input_filenames"]
         )
+        # The available spectra of each reference set, stored as one
+        # dict per row so that the DataFrame is not indexed in loops.
+        self.reference_sets = [
+            {
+                label: spectrum
+                for label, spectrum in record.items()
+                if pd.notnull(spectrum)
+            }
+            for record in self.input_spectra.to_dict("records")
+        ]
 
         # No. of parameter = 1 ref_set + no. of linear parameter + 6
         # (one parameter each for resolution, shift_x, signal_to noise,
@@ -151,24 +171,30 @@ class Creator:
         """
         input_spectra = pd.DataFrame(columns=self.spectra)
 
-        input_datapath = os.path.join(
-            *[
-                os.path.dirname(os.path.abspath(__file__)).partition(
-                    "simulation"
-                )[0],
-                "data",
-                "references",
-            ]
+        # Files that are used in several reference sets are only
+        # loaded once. Loading is I/O-bound, so it is done in threads.
+        unique_filenames = list(
+            dict.fromkeys(
+                filename
+                for value_list in filenames.values()
+                for filename in value_list
+            )
         )
+        with ThreadPoolExecutor() as executor:
+            loaded_spectra = dict(
+                zip(
+                    unique_filenames,
+                    executor.map(
+                        self._load_measured_spectrum, unique_filenames
+                    ),
+                )
+            )
 
         input_spectra_list = []
         for set_key, value_list in filenames.items():
             ref_spectra_dict = {}
             for filename in value_list:
-                filepath = os.path.join(input_datapath, filename)
-                measured_spectrum = MeasuredSpectrum(filepath)
-                if self.params["normalize_inputs"]:
-                    measured_spectrum.normalize()
+                measured_spectrum = loaded_spectra[filename]
                 label = next(iter(measured_spectrum.label.keys()))
                 ref_spectra_dict[label] = measured_spectrum
             input_spectra_list.append(ref_spectra_dict)
@@ -178,6 +204,28 @@ class Creator:
             join="outer",
         )
 
+    def _load_measured_spectrum(self, filename):
+        """
+        Load and optionally normalize one reference spectrum.
+
+        Parameters
+        ----------
+        filename : str
+            Filename relative to the references data folder.
+
+        Returns
+        -------
+        measured_spectrum : MeasuredSpectrum
+            The loaded reference spectrum.
+
+        """
+        filepath = os.path.join(REFERENCE_DATAPATH, filename)
+        measured_spectrum = MeasuredSpectrum(filepath)
+        if self.params["normalize_inputs"]:
+            measured_spectrum.normalize()
+
+        return measured_spectrum
+
     def create_matrix(
         self,
         single=False,
@@ -223,22 +271,17 @@ class Creator:
         None.
 
         """
-        for i in range(self.no_of_simulations):
-            key = (
-                self.select_reference_set()
-            )  # select a set of references
-            self.simulation_matrix[i, 0] = int(key)
+        # Select all reference sets at once.
+        keys = self.select_reference_set(size=self.no_of_simulations)
+        self.simulation_matrix[:, 0] = keys
 
+        for i, key in enumerate(keys):
             self.simulation_matrix[
                 i, 1 : self.no_of_linear_params + 1
             ] = self.select_scaling_params(
                 key, single, variable_no_of_inputs, always_auger
             )
 
-            self.simulation_matrix[
-                i, self.no_of_linear_params + 1 :
-            ] = self.select_sim_params(key)
-
             print(
                 "Random parameters: "
                 + str(i + 1)
@@ -246,18 +289,32 @@ class Creator:
                 + str(self.no_of_simulations)
             )
 
-    def select_reference_set(self):
+        # The other simulation parameters are independent of the
+        # linear combination and can be drawn for all rows at once.
+        self.simulation_matrix[
+            :, self.no_of_linear_params + 1 :
+        ] = self.select_sim_params(keys)
+
+    def select_reference_set(self, size=None):
         """
         Randomly select a number for calling one of the reference sets.
 
+        Parameters
+        ----------
+        size : int, optional
+            Number of reference sets to select. If None, a single
+            number is returned. The default is None.
+
         Returns
         -------
-        int
+        int or ndarray
             A number between 0 and the total number of input
-            reference sets.
+            reference sets (or an array of such numbers).
 
         """
-        return np.random.randint(0, self.input_spectra.shape[0])
+        return self.rng.integers(
+            0, self.input_spectra.shape[0], size=size
+        )
 
     def select_scaling_params(
         self,
@@ -304,30 +361,23 @@ class Creator:
         """
         linear_params = [0.0] * self.no_of_linear_params
 
-        # Get input spectra from one set of references.
-        inputs = self.input_spectra.iloc[[key]]
+        # Get available input spectra from one set of references.
+        inputs = self.reference_sets[key]
 
         # Select indices where a spectrum is available for this key.
-        indices = [
-            self.spectra.index(j)
-            for j in inputs.columns[
-                inputs.isnull().any() == False
-            ].tolist()
-        ]
+        indices = [self.spectra.index(j) for j in inputs]
         indices_empty = [
-            self.spectra.index(j)
-            for j in inputs.columns[inputs.isnull().any()].tolist()
+            i for i, j in enumerate(self.spectra) if j not in inputs
         ]
 
         # This ensures that always just one Auger region is used.
         auger_spectra = []
         core_spectra = []
-        for s in inputs.iloc[0]:
-            if str(s) != "nan":
-                if s.spectrum_type == "auger":
-                    auger_spectra.append(s)
-                if s.spectrum_type == "core_level":
-                    core_spectra.append(s)
+        for s in inputs.values():
+            if s.spectrum_type == "auger":
+                auger_spectra.append(s)
+            if s.spectrum_type == "core_level":
+                core_spectra.append(s)
         auger_region = self._select_one_auger_region(auger_spectra)
 
         selected_auger_spectra = [
@@ -343,28 +393,27 @@ class Creator:
             )
         ]
         selected_auger_indices = [
-            inputs.columns.get_loc(list(s.label.keys())[0])
+            self.spectra.index(list(s.label.keys())[0])
             for s in selected_auger_spectra
         ]
         unselected_auger_indices = [
-            inputs.columns.get_loc(list(s.label.keys())[0])
+            self.spectra.index(list(s.label.keys())[0])
             for s in unselected_auger_spectra
         ]
 
         if single:
             # Set one parameter to 1 and others to 0.
-            q = np.random.choice(indices)
+            q = self.rng.choice(indices)
             linear_params[q] = 1.0
         else:
             if variable_no_of_inputs:
                 # Randomly choose how many spectra shall be combined
-                no_of_spectra = np.random.randint(1, len(indices) + 1)
+                no_of_spectra = self.rng.integers(1, len(indices) + 1)
                 params = [0.0] * no_of_spectra
                 while sum(params) == 0.0:
-                    params = [
-                        np.random.uniform(0.1, 1.0)
-                        for j in range(no_of_spectra)
-                    ]
+                    params = list(
+                        self.rng.uniform(0.1, 1.0, size=no_of_spectra)
+                    )
 
                     params = self._normalize_float_list(params)
                     # Don't allow parameters below 0.1.
@@ -380,23 +429,18 @@ class Creator:
 
             else:
                 # Linear parameters
-                r = [
-                    np.random.uniform(0.1, 1.0)
-                    for j in range(len(indices))
-                ]
-                params = self._normalize_float_list(r)
+                r = self.rng.uniform(0.1, 1.0, size=len(indices))
+                r /= r.sum()
 
-                while all(p >= 0.1 for p in params) is not False:
+                while (r >= 0.1).all():
                     # sample again if one of the parameters is smaller
                     # than 0.1.
-                    r = [
-                        np.random.uniform(0.1, 1.0)
-                        for j in range(len(indices))
-                    ]
-                    params = self._normalize_float_list(r)
+                    r = self.rng.uniform(0.1, 1.0, size=len(indices))
+                    r /= r.sum()
+                params = list(r)
 
             # Randomly shuffle so that zeros are equally distributed.
-            np.random.shuffle(params)
+            self.rng.shuffle(params)
             # Add linear params at the positions where there
             # are reference spectra available
             param_iter = iter(params)
@@ -412,7 +456,7 @@ class Creator:
                 p == 0.0
                 for p in [linear_params[i] for i in test_indices]
             ):
-                np.random.shuffle(params)
+                self.rng.shuffle(params)
                 param_iter = iter(params)
                 for index in indices:
                     linear_params[index] = next(param_iter)
@@ -455,7 +499,7 @@ class Creator:
             # Always use at least one core level spectrum
             # when available.
             core_level_indices = [
-                inputs.columns.get_loc(list(s.label.keys())[0])
+                self.spectra.index(list(s.label.keys())[0])
                 for s in core_spectra
             ]
             if all(
@@ -472,113 +516,134 @@ class Creator:
 
         return linear_params
 
-    def select_sim_params(self, row):
+    def select_sim_params(self, keys):
         """
-        Select parameters for one row in the simulation matrix.
+        Select the simulation parameters for all rows at once.
 
         Parameters
         ----------
-        row : int
-            Row in the simulation matrix to fill.
+        keys : ndarray
+            1D array with the reference set used in each row of the
+            simulation matrix.
 
         Returns
         -------
-        sim_params : list
-            List of parameters for changing a spectrum using
-            various processing steps.
+        sim_params : ndarray
+            Array of shape (len(keys), 6) with parameters for changing
+            a spectrum using various processing steps.
 
         """
-        sim_params = [0.0] * 6
+        size = len(keys)
+        sim_params = np.zeros((size, 6))
 
         # FWHM
-        sim_params[-6] = self._select_random_fwhm()
+        sim_params[:, -6] = self._select_random_fwhm(size)
 
         # shift_x
-        # Get step from first existing spectrum
-        for spectrum in self.input_spectra.iloc[row]:
-            try:
-                step = spectrum.step
-                break
-            except AttributeError:
-                continue
-        sim_params[-5] = self._select_random_shift_x(step)
+        # Get step from first existing spectrum in each reference set.
+        steps = np.array(
+            [
+                self._get_step(key)
+                for key in range(self.input_spectra.shape[0])
+            ]
+        )
+        sim_params[:, -5] = self._select_random_shift_x(steps[keys])
 
         # Signal-to-noise
-        sim_params[-4] = self._select_random_noise()
+        sim_params[:, -4] = self._select_random_noise(size)
 
         # Scattering
         # Scatterer
-        sim_params[-3] = self._select_random_scatterer()
-        # Pressurex
-        sim_params[-2] = self._select_random_scatter_pressure()
+        sim_params[:, -3] = self._select_random_scatterer(size)
+        # Pressure
+        sim_params[:, -2] = self._select_random_scatter_pressure(size)
         # Distance
-        sim_params[-1] = self._select_random_scatter_distance()
+        sim_params[:, -1] = self._select_random_scatter_distance(size)
 
         return sim_params
 
-    def _select_random_fwhm(self):
+    def _get_step(self, key):
+        """
+        Get the step width of the first spectrum in a reference set.
+
+        Parameters
+        ----------
+        key : int
+            Integer number of the reference spectrum set to use.
+
+        Returns
+        -------
+        step : float
+            Step width of the first available spectrum.
+
+        """
+        return next(iter(self.reference_sets[key].values())).step
+
+    def _select_random_fwhm(self, size):
         if self.params["broaden"] is not False:
-            return np.random.randint(
-                self.sim_ranges["FWHM"][0], self.sim_ranges["FWHM"][1]
+            return self.rng.integers(
+                self.sim_ranges["FWHM"][0],
+                self.sim_ranges["FWHM"][1],
+                size=size,
             )
-        return 0
+        return np.zeros(size)
 
-    def _select_random_shift_x(self, step):
+    def _select_random_shift_x(self, steps):
         if self.params["shift_x"] is not False:
-            shift_range = np.arange(
-                self.sim_ranges["shift_x"][0],
-                self.sim_ranges["shift_x"][1],
-                step,
-            )
-            r = np.round(
-                np.random.randint(0, len(shift_range)), decimals=2
-            )
-            if -step < shift_range[r] < step:
-                shift_range[r] = 0
-
-            return shift_range[r]
-        return 0
-
-    def _select_random_noise(self):
+            start, stop = self.sim_ranges["shift_x"]
+            # Equivalent to picking a random element of
+            # np.arange(start, stop, step) for each step.
+            range_lengths = np.ceil((stop - start) / steps).astype(int)
+            r = self.rng.integers(0, range_lengths)
+            shifts = start + r * steps
+            shifts[(-steps < shifts) & (shifts < steps)] = 0
+
+            return shifts
+        return np.zeros(len(steps))
+
+    def _select_random_noise(self, size):
         if self.params["noise"] is not False:
             return (
-                np.random.randint(
+                self.rng.integers(
                     self.sim_ranges["noise"][0] * 1000,
                     self.sim_ranges["noise"][1] * 1000,
+                    size=size,
                 )
                 / 1000
             )
-        return 0
+        return np.zeros(size)
 
-    def _select_random_scatterer(self):
+    def _select_random_scatterer(self, size):
         if self.params["scatter"] is not False:
             # Scatterer ID
-            return np.random.randint(
-                0, len(self.sim_ranges["scatterers"].keys())
+            return self.rng.integers(
+                0, len(self.sim_ranges["scatterers"].keys()), size=size
             )
-        return None
+        return np.full(size, np.nan)
 
-    def _select_random_scatter_pressure(self):
+    def _select_random_scatter_pressure(self, size):
         if self.params["scatter"] is not False:
             return (
-                np.random.randint(
+                self.rng.integers(
                     self.sim_ranges["pressure"][0] * 10,
                     self.sim_ranges["pressure"][1] * 10,
+                    size=size,
                 )
                 / 10
             )
-        return 0
+        return np.zeros(size)
 
-    def _select_random_scatter_distance(self):
+    def _select_random_scatter_distance(self, size):
         if self.params["scatter"] is not False:
             return (
-                np.random.randint(
+                self.rng.integers(
                     self.sim_ranges["distance"][0] * 100,
                     self.sim_ranges["distance"][1] * 100,
+                    size=size,
                 )
                 / 100
             )
-        return 0
+        return np.zeros(size)
 
     def _select_one_auger_region(self, auger_spectra):
         """
@@ -602,7 +667,7 @@ class Creator:
         )
         auger_regions = list(auger_regions)
 
-        r = np.random.randint(0, len(auger_regions))
+        r = self.rng.integers(0, len(auger_regions))
 
         return auger_regions[r]
 
@@ -691,66 +756,92 @@ class Creator:
         None.
 
         """
-        dict_list = []
+        # Pre-allocate the columns of the output DataFrame. Numeric
+        # columns are stored in arrays, everything else in lists.
+        n = self.no_of_simulations
+        columns = {
+            "reference_set": np.empty(n, dtype=int),
+            "label": [None] * n,
+            "shift_x": np.empty(n),
+            "noise": np.empty(n),
+            "FWHM": np.empty(n),
+            "scatterer": [None] * n,
+            "distance": np.empty(n),
+            "pressure": np.empty(n),
+            "x": [None] * n,
+            "y": [None] * n,
+        }
+
+        # One Simulation per reference set is reused for all
+        # simulations with that reference set.
+        simulations = {}
+        # The energy axis only depends on the reference set, so all
+        # rows of one reference set share the same x array.
+        x_axes = {}
+
+        # Column views of the simulation matrix.
+        ref_set_keys = self.simulation_matrix[:, 0].astype(int)
+        linear_params = self.simulation_matrix[
+            :, 1 : self.no_of_linear_params + 1
+        ]
+        fwhms = self.simulation_matrix[:, -6]
+        shifts_x = self.simulation_matrix[:, -5]
+        signals_to_noise = self.simulation_matrix[:, -4]
+        scatterer_ids = self.simulation_matrix[:, -3]
+        pressures = self.simulation_matrix[:, -2]
+        distances = self.simulation_matrix[:, -1]
+
         for i in range(self.no_of_simulations):
-            ref_set_key = int(self.simulation_matrix[i, 0])
-
-            # Only select input spectra and scaling parameter
-            # for the references that are avalable.
-            sim_input_spectra = [
-                spectrum
-                for spectrum in self.input_spectra.iloc[
-                    ref_set_key
-                ].tolist()
-                if str(spectrum) != "nan"
-            ]
+            ref_set_key = ref_set_keys[i]
 
-            scaling_params = [
-                p
-                for p in self.simulation_matrix[i][
-                    1 : self.no_of_linear_params + 1
-                ]
-                if str(p) != "nan"
-            ]
+            if ref_set_key in simulations:
+                self.sim = simulations[ref_set_key]
+                self.sim.reset()
+            else:
+                # Only select input spectra for the references
+                # that are avalable.
+                sim_input_spectra = list(
+                    self.reference_sets[ref_set_key].values()
+                )
+                self.sim = Simulation(sim_input_spectra)
+                simulations[ref_set_key] = self.sim
 
-            self.sim = Simulation(sim_input_spectra)
+            # Only select scaling parameter for the references
+            # that are avalable.
+            scaling_params = linear_params[i][
+                ~np.isnan(linear_params[i])
+            ].tolist()
 
             self.sim.combine_linear(scaling_params=scaling_params)
 
-            fwhm = self.simulation_matrix[i][-6]
-            shift_x = self.simulation_matrix[i][-5]
-            signal_to_noise = self.simulation_matrix[i][-4]
-            scatterer_id = self.simulation_matrix[i][-3]
-            distance = self.simulation_matrix[i][-2]
-            pressure = self.simulation_matrix[i][-1]
-
             try:
                 # In order to assign a label, the scatterers are encoded
                 # by numbers.
                 scatterer_label = self.sim_ranges["scatterers"][
-                    str(int(scatterer_id))
+                    str(int(scatterer_ids[i]))
                 ]
             except ValueError:
                 scatterer_label = None
 
             self.sim.change_spectrum(
-                fwhm=fwhm,
-                shift_x=shift_x,
-                signal_to_noise=signal_to_noise,
+                fwhm=fwhms[i],
+                shift_x=shifts_x[i],
+                signal_to_noise=signals_to_noise[i],
                 scatterer={
                     "label": scatterer_label,
-                    "distance": distance,
-                    "pressure": pressure,
+                    "distance": distances[i],
+                    "pressure": pressures[i],
                 },
             )
 
             if self.params["normalize_outputs"]:
                 self.sim.output_spectrum.normalize()
 
-            d1 = {"reference_set": ref_set_key}
-            d2 = self._dict_from_one_simulation(self.sim)
-            d = {**d1, **d2}
-            dict_list.append(d)
+            columns["reference_set"][i] = ref_set_key
+            d = self._dict_from_one_simulation(self.sim)
+            d["x"] = x_axes.setdefault(ref_set_key, d["x"])
+            for key, value in d.items():
+                columns[key][i] = value
             print(
                 "Simulation: "
                 + str(i + 1)
@@ -762,7 +853,7 @@ class Creator:
             "Number of created spectra: " + str(self.no_of_simulations)
         )
 
-        self.df = pd.DataFrame(dict_list)
+        self.df = pd.DataFrame(columns)
 
         if self.params["ensure_same_length"]:
             self.df = self._extend_spectra_in_df(self.df)
@@ -801,9 +892,11 @@ class Creator:
 
         spectrum.label = new_label
 
+        # The simulation itself runs in double precision, but single
+        # precision is sufficient for storing the output spectra.
         y = np.reshape(
             spectrum.lineshape, (spectrum.lineshape.shape[0], -1)
-        )
+        ).astype(np.float32)
 
         d = {
             "label": spectrum.label,
@@ -842,9 +935,12 @@ class Creator:
 
         data_list = df[["x", "y"]].values.tolist()
         new_spectra = []
+        # Rows that shared an x array keep sharing the extended one.
+        x_axes = {}
 
         for (x, y) in data_list:
             x_new, y_new = self._extend_xy(x, y, max_length)
+            x_new = x_axes.setdefault(id(x), x_new)
             new_data_dict = {"x": x_new, "y": y_new}
             new_spectra.append(new_data_dict)
 
@@ -916,7 +1012,7 @@ class Creator:
             stop = stop0 + int(len_diff / 2) * step0
 
             X = np.flip(safe_arange_with_edges(start, stop, step0))
-            Y = np.zeros(shape=(X.shape[0], 1))
+            Y = np.zeros(shape=(X.shape[0], 1), dtype=Y0.dtype)
 
             Y[: int(len_diff / 2)] = np.mean(Y0[:20])
             Y[int(len_diff / 2) : -int(len_diff / 2)] = Y0
@@ -941,18 +1037,20 @@ class Creator:
         None.
 
         """
+        # Matplotlib is only imported here so that it is not loaded
+        # for pure simulation runs.
+        import matplotlib.pyplot as plt
+        from base_model.figures import Figure
+
         if no_of_spectra > self.no_of_simulations:
             # In this case, plot all spectra.
             no_of_spectra = self.no_of_simulations
 
-        random_numbers = []
-        for i in range(no_of_spectra):
-            r = np.random.randint(0, self.no_of_simulations)
-            while r in random_numbers:
-                # prevent repeating figures
-                r = np.random.randint(0, self.no_of_simulations)
-            random_numbers.append(r)
-
+        # Sample without replacement to prevent repeating figures.
+        random_numbers = self.rng.choice(
+            self.no_of_simulations, size=no_of_spectra, replace=False
+        )
+        for r in random_numbers:
             row = self.df.iloc[r]
             x = row["x"]
             y = row["y"]
@@ -984,55 +1082,36 @@ class Creator:
         None
 
         """
-        linear_params_text = ""
-        for key in self.labels:
-            linear_params_text += (
-                str(key)
-                + ": "
-                + str(np.round(df_row["label"][key], decimals=2))
-                + "\n"
-            )
+        lines = [
+            f"{key}: {round(df_row['label'][key], 2)}"
+            for key in self.labels
+        ]
+        lines.append("")
 
-        params_text = "\n"
         if df_row["FWHM"] is not None and df_row["FWHM"] != 0:
-            params_text += (
-                "FHWM: "
-                + str(np.round(df_row["FWHM"], decimals=2))
-                + "\n"
-            )
+            lines.append(f"FHWM: {round(df_row['FWHM'], 2)}")
         else:
-            params_text += "FHWM: not changed" + "\n"
+            lines.append("FHWM: not changed")
 
         if df_row["shift_x"] is not None and df_row["shift_x"] != 0:
-            params_text += (
-                "X shift: " + "{:.3f}".format(df_row["shift_x"]) + "\n"
-            )
+            lines.append(f"X shift: {df_row['shift_x']:.3f}")
         else:
-            params_text += "X shift: none" + "\n"
+            lines.append("X shift: none")
 
         if df_row["noise"] is not None and df_row["noise"] != 0:
-            params_text += (
-                "S/N: " + "{:.1f}".format(df_row["noise"]) + "\n"
-            )
+            lines.append(f"S/N: {df_row['noise']:.1f}")
         else:
-            params_text += "S/N: not changed" + "\n"
+            lines.append("S/N: not changed")
 
-        scatter_text = "\n"
+        lines.append("")
         if df_row["scatterer"] is not None:
-            scatter_text += (
-                "Scatterer: " + str(df_row["scatterer"]) + "\n"
-            )
-            scatter_text += (
-                "Pressure: " + str(df_row["pressure"]) + " mbar" + "\n"
-            )
-            scatter_text += (
-                "Distance: " + str(df_row["distance"]) + " mm" + "\n"
-            )
-
+            lines.append(f"Scatterer: {df_row['scatterer']}")
+            lines.append(f"Pressure: {df_row['pressure']} mbar")
+            lines.append(f"Distance: {df_row['distance']} mm")
         else:
-            scatter_text += "Scattering: none" + "\n"
+            lines.append("Scattering: none")
 
-        return linear_params_text + params_text + scatter_text
+        return "\n".join(lines) + "\n"
 
     def _prepare_metadata_after_run(self):
         """
@@ -1057,6 +1136,7 @@ class FileWriter:
         self.params = params
         self.name = self.params["name"]
         self.labels = self.params["labels"]
+        self.rng = np.random.default_rng()
 
     def to_file(self, filetypes, metadata=True):
         """
@@ -1067,7 +1147,7 @@ class FileWriter:
         filepath : str
             Filepath of the output file.
         filetype : str
-            Options: 'excel', 'json', 'txt', 'pickle'
+            Options: 'excel', 'json', 'pickle', 'hdf5', 'parquet'
         Returns
         -------
         None.
@@ -1083,7 +1163,7 @@ class FileWriter:
 
         self.filepath = os.path.join(datafolder, self.name)
 
-        valid_filetypes = ["excel", "json", "pickle", "hdf5"]
+        valid_filetypes = ["excel", "json", "pickle", "hdf5", "parquet"]
 
         for filetype in filetypes:
             if filetype not in valid_filetypes:
@@ -1113,6 +1193,8 @@ class FileWriter:
             If "excel", pickle the data and save it.
             If "hdf5", calle the helper method "prepare_hdf5" and store
             the data in an HDF5 file.
+            If "parquet", save the data to a snappy-compressed Parquet
+            file (requires pyarrow).
 
 
         Returns
@@ -1127,15 +1209,20 @@ class FileWriter:
 
         if filetype == "json":
             self.json_filepath = filename + ".json"
-
-            with open(self.json_filepath, "w") as json_file:
-                df.to_json(json_file, orient="records")
+            # Let pandas open and write the file itself. The output
+            # stays a JSON array of records, as expected by
+            # json_to_hdf5.py.
+            df.to_json(self.json_filepath, orient="records")
 
         if filetype == "pickle":
             self.pkl_filepath = filename + ".pkl"
             with open(self.pkl_filepath, "wb") as pickle_file:
                 df.to_pickle(pickle_file)
 
+        if filetype == "parquet":
+            self.parquet_filepath = filename + ".parquet"
+            self._write_parquet(df, self.parquet_filepath)
+
         if filetype == "hdf5":
             print("Saving data to HDF5...")
             self.hdf5_filepath = filename + ".h5"
@@ -1145,12 +1232,26 @@ class FileWriter:
             with h5py.File(self.hdf5_filepath, "w") as hf:
                 for key, value in hdf5_data.items():
                     try:
-                        hf.create_dataset(
-                            key,
-                            data=value,
-                            compression="gzip",
-                            chunks=True,
-                        )
+                        if key == "X":
+                            # Chunks of whole spectra match the
+                            # contiguous row slabs read for training.
+                            hf.create_dataset(
+                                key,
+                                data=value,
+                                compression="gzip",
+                                shuffle=True,
+                                chunks=(
+                                    min(256, value.shape[0]),
+                                )
+                                + value.shape[1:],
+                            )
+                        else:
+                            hf.create_dataset(
+                                key,
+                                data=value,
+                                compression="gzip",
+                                chunks=True,
+                            )
                     except TypeError:
                         value = np.array(value, dtype=object)
                         string_dt = h5py.special_dtype(vlen=str)
@@ -1163,6 +1264,63 @@ class FileWriter:
                         )
                     print("Saved " + key + " to HDF5 file.")
 
+    def _write_parquet(self, df, filepath, batch_size=2048):
+        """
+        Write the data to a Parquet file in row groups.
+
+        Every batch of rows is converted to an Arrow table and written
+        on its own, so only one batch is held in Arrow format at a
+        time.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Dataframe containing the result of a simulation process.
+        filepath : str
+            Path of the Parquet file.
+        batch_size : int, optional
+            Number of spectra per row group. The default is 2048.
+
+        Returns
+        -------
+        None.
+
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        def to_table(batch, schema=None):
+            # Parquet only supports 1D arrays in list columns.
+            batch = batch.assign(y=[np.ravel(y) for y in batch["y"]])
+            return pa.Table.from_pandas(
+                batch, schema=schema, preserve_index=False
+            )
+
+        # The array columns are typed from the first spectrum, all
+        # other columns from the whole dataframe. This way, columns
+        # that are empty in some batches (e.g. "scatterer") are
+        # written with the same type in every row group.
+        array_schema = to_table(df.iloc[:1]).schema
+        other_schema = pa.Schema.from_pandas(
+            df.drop(columns=["x", "y"]), preserve_index=False
+        )
+        schema = pa.schema(
+            [
+                array_schema.field(name)
+                if name in ("x", "y")
+                else other_schema.field(name)
+                for name in df.columns
+            ],
+            metadata=array_schema.metadata,
+        )
+
+        with pq.ParquetWriter(
+            filepath, schema, compression="snappy"
+        ) as writer:
+            for start in range(0, len(df), batch_size):
+                batch = df.iloc[start : start + batch_size]
+                writer.write_table(to_table(batch, schema=schema))
+
     def prepare_hdf5(self, df):
         """
         Store the DataFrame from a simulation run in a dictionary.
@@ -1180,82 +1338,52 @@ class FileWriter:
             distance, and pressure,
 
         """
-        X = []
-        y = []
-        shiftx = []
-        noise = []
-        FWHM = []
-        scatterer = []
-        distance = []
-        pressure = []
-
         energies = df["x"][0]
-        for index, row in df.iterrows():
-            X_one = row["y"]
-            if self.params["eV_window"]:
-                from pandas.core.common import SettingWithCopyWarning
+        spectra = df["y"].tolist()
 
-                warnings.simplefilter(
-                    action="ignore", category=SettingWithCopyWarning
-                )
-                # Only select a random window of some eV as output.
-                step = self.params["energy_range"][-1]
-                eV_window = self.params["eV_window"]
-                window = int(eV_window / step) + 1
-                r = np.random.randint(0, X_one.shape[0] - window)
-                X_one = X_one[r : r + window]
-                self.df["x"][index] = np.flip(
-                    safe_arange_with_edges(0, eV_window, step)
-                )
-                self.df["y"][index] = X_one
-                energies = self.df["x"][index]
-            y_one = row["label"]
-            shiftx_one = row["shift_x"]
-            noise_one = row["noise"]
-            FWHM_one = row["FWHM"]
-            scatterer_name = row["scatterer"]
-            scatterers = {"He": 0, "H2": 1, "N2": 2, "O2": 3}
-            try:
-                scatterer_one = scatterers[scatterer_name]
-            except KeyError:
-                scatterer_one = float("NAN")
-            distance_one = row["distance"]
-            pressure_one = row["pressure"]
-
-            X.append(X_one)
-            y.append(y_one)
-            shiftx.append(shiftx_one)
-            noise.append(noise_one)
-            FWHM.append(FWHM_one)
-            scatterer.append(scatterer_one)
-            distance.append(distance_one)
-            pressure.append(pressure_one)
-
-            print(
-                "Prepare HDF5 upload: "
-                + str(index)
-                + "/"
-                + str(df.shape[0])
-            )
+        if self.params["eV_window"]:
+            # Only select a random window of some eV as output. The
+            # offset of each spectrum is bounded by its own length, so
+            # spectra of different lengths can be cropped and stacked.
+            step = self.params["energy_range"][-1]
+            eV_window = self.params["eV_window"]
+            window = int(eV_window / step) + 1
+            lengths = np.array([len(X_one) for X_one in spectra])
+            r = self.rng.integers(0, lengths - window)
+            spectra = [
+                X_one[r_one : r_one + window]
+                for X_one, r_one in zip(spectra, r)
+            ]
 
-        X = np.array(X, dtype=np.float)
         try:
+            X = np.stack(spectra).astype(np.float32)
             X = np.reshape(X, (X.shape[0], X.shape[1], -1))
-        except IndexError:
+        except ValueError:
             raise IndexError(
                 "Could not concatenate individual spectra because their"
                 'sizes are different. Either set "ensure_same_length"'
                 'to True or "eV_window" to a finite integer!'
             )
 
-        y = self._one_hot_encode(y)
+        if self.params["eV_window"]:
+            energies = np.flip(
+                safe_arange_with_edges(0, eV_window, step)
+            )
+            self.df["x"] = [energies] * X.shape[0]
+            self.df["y"] = spectra
 
-        shiftx = np.reshape(np.array(shiftx), (-1, 1))
-        noise = np.reshape(np.array(noise), (-1, 1))
-        FWHM = np.reshape(np.array(FWHM), (-1, 1))
-        scatterer = np.reshape(np.array(scatterer), (-1, 1))
-        distance = np.reshape(np.array(distance), (-1, 1))
-        pressure = np.reshape(np.array(pressure), (-1, 1))
+        y = self._one_hot_encode(df["label"].tolist())
+
+        scatterers = {"He": 0, "H2": 1, "N2": 2, "O2": 3}
+
+        shiftx = df["shift_x"].to_numpy().reshape(-1, 1)
+        noise = df["noise"].to_numpy().reshape(-1, 1)
+        FWHM = df["FWHM"].to_numpy().reshape(-1, 1)
+        scatterer = (
+            df["scatterer"].map(scatterers).to_numpy().reshape(-1, 1)
+        )
+        distance = df["distance"].to_numpy().reshape(-1, 1)
+        pressure = df["pressure"].to_numpy().reshape(-1, 1)
 
         return {
             "X": X,
@@ -8,7 +8,6 @@ Created on Thu May  7 11:25:02 2020.
 import numpy as np
 import os
 from base_model.spectra import MeasuredSpectrum, SimulatedSpectrum
-from base_model.figures import Figure
 
 #%%
 class Simulation:
@@ -54,13 +53,27 @@ class Simulation:
             # Only use parameters of core level spectra.
             input_spectrum = next(iter(input_spectra))
 
-        start = input_spectrum.start
-        stop = input_spectrum.stop
-        step = input_spectrum.step
-        label = ""
+        self.start = input_spectrum.start
+        self.stop = input_spectrum.stop
+        self.step = input_spectrum.step
+
+        self.reset()
+
+    def reset(self):
+        """
+        Reset the output spectrum to an empty SimulatedSpectrum.
 
+        This allows to reuse the same Simulation object for several
+        simulations with the same input spectra.
+
+        Returns
+        -------
+        None.
+
+        """
+        label = ""
         self.output_spectrum = SimulatedSpectrum(
-            start, stop, step, label
+            self.start, self.stop, self.step, label
         )
 
     def combine_linear(self, scaling_params):
@@ -82,12 +95,12 @@ class Simulation:
         None.
 
         """
-        sim_spectra = self.core_spectra
-
         shifted_auger_spectra = self._position_augers_randomly(
             self.output_spectrum.x, self.auger_spectra
         )
-        sim_spectra.extend(shifted_auger_spectra)
+        # Do not extend self.core_spectra in place so that the
+        # Simulation can be reused.
+        sim_spectra = self.core_spectra + shifted_auger_spectra
 
         # Make sure that the right amount of params is given.
         if len(sim_spectra) < len(scaling_params):
@@ -103,24 +116,23 @@ class Simulation:
         else:
             self.output_spectrum.label = {}
             if np.round(sum(scaling_params), decimals=1) == 1.0:
-                output_list = []
-
                 for i, sim_spectrum in enumerate(sim_spectra):
                     # Species = List of input spectra names
                     species = list(sim_spectrum.label.keys())[0]
                     concentration = scaling_params[i]
 
-                    intensity = (
-                        sim_spectrum.lineshape * scaling_params[i]
-                    )
-                    output_list.append(intensity)
-
                     # For each species, the label gets a new key:value
                     # pair of the format species: concentration
                     self.output_spectrum.label[species] = concentration
 
-                # Linear combination
-                self.output_spectrum.lineshape = sum(output_list)
+                # Linear combination as one matrix-vector product of
+                # the scaling parameters and the stacked lineshapes.
+                lineshapes = np.stack(
+                    [spectrum.lineshape for spectrum in sim_spectra]
+                )
+                self.output_spectrum.lineshape = np.dot(
+                    scaling_params, lineshapes
+                )
 
             else:
                 print("Scaling parameters have to sum to 1!")
@@ -301,6 +313,8 @@ class Simulation:
         None.
 
         """
+        from base_model.figures import Figure
+
         if plot_inputs:
             figs_input = []
             for spectrum in self.input_spectra: